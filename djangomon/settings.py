@@ -120,3 +120,30 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Pokemon AI
+# Maximum number of entries in the process-wide caches of pokemon.ai.
+
+AI_DAMAGE_CACHE_SIZE = 1024
+AI_FAINT_CACHE_SIZE = 65536
+AI_TRANSPOSITION_TABLE_SIZE = 200000
+
+# Maximum number of turns that the AI looks ahead, and the faint probability
+# (1 - epsilon) after which it stops looking further.
+AI_MAX_TURNS = 10
+AI_HORIZON_EPSILON = 1e-14
+
+# File (shelve) to keep the moves selected by the AI between runs of the simulator,
+# None to disable. The file is not used after the pokemon data or the settings above
+# have changed.
+AI_TRANSPOSITION_TABLE_FILE = None
+
+# Count and time the hot paths of the simulator, see pokemon.instrumentation.
+SIMULATOR_INSTRUMENTATION = False
+
+# Pokemon API, see pokemon.pokeapi. Responses are cached in POKEAPI_CACHE_DIR,
+# delete the directory to download the data again.
+POKEAPI_URL = 'https://pokeapi.co/api/v2/'
+POKEAPI_CACHE_DIR = os.path.join(BASE_DIR, 'pokeapi_cache')
+POKEAPI_MAX_WORKERS = 8
@@ -1,19 +1,45 @@
 from collections import Counter
 
 from django.contrib import admin
-from django.db.models import Q
+from django.db.models import F, FilteredRelation, Q
 from django.utils.html import format_html
 
-from .models import Ability, Move, Nature, Pokemon, Species, Type, BattleLog
+from . import pokemon_cache
+from .models import (
+    Ability, Move, Nature, Pokemon, Species, Type, BattleLog, BattleTurn, DataVersion, Matchup, PokemonRecord,
+    Tournament
+)
 
-admin.site.register((Nature, Type))
+admin.site.register((Nature, Type, Tournament))
 
 
 @admin.register(BattleLog)
 class BattleLogAdmin(admin.ModelAdmin):
     search_fields = ['winner__species__name', 'loser__species__name']
     list_filter = ['winner', 'loser']
-    list_display = ['id', 'winner', 'loser']
+    list_display = ['id', 'winner', 'loser', 'turns', 'hp_left']
+    exclude = ['report']
+    readonly_fields = ['battle_report']
+
+    def battle_report(self, battle_log):
+        """The stored report or, for compact logs, the replayed battle."""
+        return format_html('<pre>{}</pre>', battle_log.get_report())
+
+
+@admin.register(Matchup)
+class MatchupAdmin(admin.ModelAdmin):
+    search_fields = ['pokemon__species__name', 'opponent__species__name']
+    list_display = ['pokemon', 'opponent', 'win_probability', 'win_rate', 'battles']
+    list_select_related = ['pokemon__species', 'opponent__species']
+
+
+@admin.register(PokemonRecord)
+class PokemonRecordAdmin(admin.ModelAdmin):
+    search_fields = ['pokemon__species__name']
+    list_display = ['pokemon', 'tournament', 'wins', 'losses', 'win_percentage', 'mean_hp_left']
+    list_filter = ['tournament']
+    list_select_related = ['pokemon__species', 'tournament']
+    ordering = ['tournament', '-win_percentage']
 
 
 @admin.register(Move)
@@ -46,6 +72,45 @@ class TypeFilter(admin.SimpleListFilter):
             )
 
 
+def selected_tournament(request):
+    """The tournament chosen in the Pokemon changelist, by default the latest finished round-robin.
+
+    Looked up once per request.
+    """
+    if request is None:
+        return Tournament.latest(Tournament.Kind.ROUND_ROBIN, finished=True)
+    if not hasattr(request, '_selected_tournament'):
+        tournament_id = request.GET.get(TournamentFilter.parameter_name, '')
+        tournament = Tournament.objects.filter(pk=tournament_id).first() if tournament_id.isdigit() else None
+        request._selected_tournament = tournament or Tournament.latest(Tournament.Kind.ROUND_ROBIN, finished=True)
+    return request._selected_tournament
+
+
+class TournamentFilter(admin.SimpleListFilter):
+    """The tournament of the win percentages, see PokemonAdmin.get_queryset."""
+    title = 'tournament'
+    parameter_name = 'tournament'
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        self.tournament = selected_tournament(request)
+
+    def lookups(self, request, model_admin):
+        return [(str(t.id), str(t)) for t in Tournament.objects.order_by('-id')]
+
+    def choices(self, changelist):
+        # No 'All': the win percentages are always those of one tournament.
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': self.tournament is not None and lookup == str(self.tournament.id),
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        return queryset     # The records of the tournament are joined by PokemonAdmin.get_queryset.
+
+
 @admin.register(Pokemon)
 class PokemonAdmin(admin.ModelAdmin):
     search_fields = ['species__name']
@@ -53,50 +118,53 @@ class PokemonAdmin(admin.ModelAdmin):
     exclude = ['cache']
     list_display = ['species', 'serebii', 'win_percentage', 'noteworthy', 'evolutions', 'used_moves', 'attacker', 'defender']
     list_select_related = ['species']
-    list_filter = [TypeFilter]
+    list_filter = [TypeFilter, TournamentFilter]
 
     def get_queryset(self, request):
-        return super().get_queryset(request).order_by('-cache__win_percentage')
-
-    def _get_cached(self, pokemon, attribute):
-        if attribute not in pokemon.cache:
-            method = getattr(self, f'_get_{attribute}')
-            pokemon.cache[attribute] = method(pokemon)
-            pokemon.save()
-        return pokemon.cache[attribute]
-
-    def _get_win_percentage(self, pokemon):
-        wins = pokemon.wins.count()
-        losses = pokemon.losses.count()
-        if wins == 0 and losses == 0:
-            return 0
-        else:
-            return round(wins / (wins+losses) * 100, 2)
-
+        """The pokemon with their record in the selected tournament (one joined query)."""
+        tournament_record = FilteredRelation('records', condition=Q(records__tournament=selected_tournament(request)))
+        return super().get_queryset(request).annotate(
+            tournament_record=tournament_record,
+            tournament_win_percentage=F('tournament_record__win_percentage'),
+        ).order_by(F('tournament_win_percentage').desc(nulls_last=True))
+
+    def get_changelist_instance(self, request):
+        """Prepare the pokemon of the page at once (a few bulk queries), see prepare()."""
+        changelist = super().get_changelist_instance(request)
+        self.prepare(changelist.result_list, selected_tournament(request))
+        return changelist
+
+    @staticmethod
+    def prepare(pokemons, tournament):
+        """Refresh the stale cache entries and count the used moves of the pokemon in the tournament.
+
+        The data versions and the counts are kept on the pokemon instances
+        (not on the admin, which is shared by all requests).
+        """
+        pokemons = list(pokemons)
+        versions = DataVersion.current()
+        pokemon_cache.refresh(pokemons, versions)
+        used_moves = {}
+        if tournament is not None:
+            used_moves = BattleTurn.used_moves(tournament, [pokemon.id for pokemon in pokemons])
+        for pokemon in pokemons:
+            pokemon._data_versions = versions
+            pokemon._used_moves = used_moves.get(pokemon.id, Counter())
+
+    @admin.display(ordering='tournament_win_percentage')
     def win_percentage(self, pokemon):
-        return self._get_cached(pokemon, 'win_percentage')
-
-    def _get_noteworthy(self, pokemon):
-        return ', '.join(str(m) for m in pokemon.moves.filter(is_noteworthy=True))
+        return pokemon.tournament_win_percentage
 
     def noteworthy(self, pokemon):
-        return self._get_cached(pokemon, 'noteworthy')
-
-    def _get_evolutions(self, pokemon):
-        evolutions = Species.objects.filter(evolves_from=pokemon.species)
-        return ', '.join(str(s) for s in evolutions)
+        return pokemon_cache.get(pokemon, 'noteworthy', getattr(pokemon, '_data_versions', None))
 
     def evolutions(self, pokemon):
-        return self._get_cached(pokemon, 'evolutions')
-
-    def _get_used_moves(self, pokemon):
-        moves = []
-        for log in BattleLog.objects.filter(Q(winner=pokemon) | Q(loser=pokemon)):
-            moves += [s.split(' ')[0] for s in log.report.split(f'\n{pokemon} uses ')[1:]]
-        return ', '.join(f'{move}: {count}' for move, count in Counter(moves).most_common())
+        return pokemon_cache.get(pokemon, 'evolutions', getattr(pokemon, '_data_versions', None))
 
     def used_moves(self, pokemon):
-        return self._get_cached(pokemon, 'used_moves')
+        if not hasattr(pokemon, '_used_moves'):
+            self.prepare([pokemon], Tournament.latest(Tournament.Kind.ROUND_ROBIN, finished=True))
+        return ', '.join(f'{move}: {count}' for move, count in pokemon._used_moves.most_common())
 
     def attacker(self, pokemon):
         attack = pokemon.species.attack
@@ -1,23 +1,111 @@
 from math import isclose, ceil
 
+import numpy as np
+from django.conf import settings
+
+from pokemon.cache import LRUCache, TranspositionTable
+
+
+# Optional DamageTable to look up damage instead of computing it, see use_damage_table().
+_damage_table = None
+
+
+def use_damage_table(damage_table):
+    """Let the AI read damage from a DamageTable (None to compute it again)."""
+    global _damage_table
+    _damage_table = damage_table
+
+
+def _table_rolls(pokemon, move, opponent):
+    """Damage for the random numbers 85 to 100 from the damage table (or None)."""
+    if _damage_table is None:
+        return None
+    return _damage_table.rolls(pokemon, move, opponent)
+
+
+def _max_damage(pokemon, move, opponent):
+    """Same as Move.max_damage, but uses the damage table when available."""
+    rolls = _table_rolls(pokemon, move, opponent)
+    if rolls is None:
+        return move.max_damage(pokemon, opponent)
+    return rolls[-1]
+
+
+def _expected_damage(pokemon, move, opponent):
+    """Same as Move.expected_damage, but uses the damage table when available."""
+    rolls = _table_rolls(pokemon, move, opponent)
+    if rolls is None:
+        return move.expected_damage(pokemon, opponent)
+    return 0.000625 * move.accuracy * sum(rolls)
+
+
+def _true_damages(pokemon, move, opponent):
+    """Damage for the random numbers 85 to 100 (see Move.true_damage)."""
+    rolls = _table_rolls(pokemon, move, opponent)
+    if rolls is None:
+        return [move.true_damage(pokemon, opponent, i) for i in range(85, 101)]
+    return rolls
+
 
 def select_move_naive(pokemon, opponent):
     """Select a move for a Pokemon when facing a certain opponent."""
     return max(
         pokemon.moves.all(),
-        key=lambda move: move.expected_damage(pokemon, opponent)
+        key=lambda move: _expected_damage(pokemon, move, opponent)
     )
 
 
 def _usable_moves(pokemon):
-    return pokemon.moves.filter(power__gt=0, nerf_factor__gt=0.0)
+    return pokemon.usable_moves()
+
+
+def _partition_key(move):
+    return (move.priority, move.accuracy, move.drain, move.recoil)
+
+
+def _build_move_index(moves):
+    """Moves that can be selected, grouped by partition key, type and damage class.
+
+    Notes:
+        Within a group, the damage of every move is computed with the same
+        stats, STAB and type effectiveness, so against any opponent the damage
+        only increases with the power. A move is therefore never the (first)
+        strongest move of its partition when an earlier move of the same group
+        has at least the same power, and it is left out.
+    """
+    groups = {}
+    for move in moves:
+        group = groups.setdefault((_partition_key(move), move.type_id, move.damage_class), [])
+        power = round(move.nerf_factor * move.power)
+        if all(power > round(other.nerf_factor * other.power) for other in group):
+            group.append(move)
+    return groups
+
+
+def _candidate_moves(pokemon):
+    """The usable moves of a pokemon, without the moves that can never be selected.
+
+    Notes:
+        The move index is stored on the pokemon (like the StatBlock) and reset
+        when its moves change, see pokemon.signals.
+    """
+    candidates = getattr(pokemon, '_move_index', None)
+    if candidates is None:
+        moves = list(_usable_moves(pokemon))
+        frontier = {move for group in _build_move_index(moves).values() for move in group}
+        candidates = [move for move in moves if move in frontier]
+        pokemon._move_index = candidates
+    return candidates
 
 
 def _benchmark_move(pokemon, opponent):
     """Basic move to compare other moves with."""
-    moves = _usable_moves(pokemon).filter(priority=0, accuracy=100, drain=0, recoil=0)
+    moves = [
+        move for move in _candidate_moves(pokemon)
+        if _partition_key(move) == (0, 100, 0, 0)
+    ]
     if moves:
-        return max(moves, key=lambda move: move.max_damage(pokemon, opponent))
+        return max(moves, key=lambda move: _max_damage(pokemon, move, opponent))
     else:
         return None
 
@@ -31,7 +119,7 @@ def _is_useful(pokemon, opponent, move, benchmark_move):
         move.accuracy > benchmark_move.accuracy) or (
         move.drain > benchmark_move.drain) or (
         move.recoil < benchmark_move.recoil) or (
-        move.max_damage(pokemon, opponent) > benchmark_move.max_damage(pokemon, opponent)
+        _max_damage(pokemon, move, opponent) > _max_damage(pokemon, benchmark_move, opponent)
     )
 
 
@@ -40,16 +128,16 @@ def _moves(pokemon, opponent):
 
     Notes:
         Only the strongest move within a set of moves with the same accuracy
-        and priority needs to be considered.
+        and priority needs to be considered. The weaker moves of the same type
+        are already left out by the move index, see _build_move_index().
     """
     benchmark_move = _benchmark_move(pokemon, opponent)
     partitions = {}
-    for move in _usable_moves(pokemon):
+    for move in _candidate_moves(pokemon):
         if _is_useful(pokemon, opponent, move, benchmark_move):
-            key = (move.priority, move.accuracy, move.drain, move.recoil)
-            partitions.setdefault(key, []).append(move)
+            partitions.setdefault(_partition_key(move), []).append(move)
     return [
-        max(partition, key=lambda move: move.max_damage(pokemon, opponent))
+        max(partition, key=lambda move: _max_damage(pokemon, move, opponent))
         for partition in partitions.values()
     ]
 
@@ -62,17 +150,112 @@ def _score(pokemon, move, opponent, opponent_moves):
     )
 
 
+# Increase when the moves selected by the AI change, so that the transposition
+# tables saved by an older version are not used.
+AI_VERSION = 2
+
+# Moves (ids) selected by select_move, shared within a run, see select_move().
+_transpositions = TranspositionTable(getattr(settings, 'AI_TRANSPOSITION_TABLE_SIZE', 200000))
+
+
+def _transposition_fingerprint(versions):
+    """Everything besides the key that the selected moves depend on.
+
+    versions are the DataVersions ({name: version}) of the pokemon data.
+    """
+    return (AI_VERSION, MAX_TURNS, HORIZON_EPSILON, tuple(sorted(versions.items())))
+
+
+def load_transpositions(path, versions):
+    """Load the selected moves that were saved by an earlier run.
+
+    Returns whether they were loaded: a file saved by another version of the
+    AI, with other horizon settings or before the pokemon data changed
+    (other versions) is ignored.
+    """
+    return _transpositions.load(path, _transposition_fingerprint(versions))
+
+
+def save_transpositions(path, versions):
+    """Save the selected moves, e.g. for the next run."""
+    _transpositions.save(path, _transposition_fingerprint(versions))
+
+
+def _transposition_key(pokemon, opponent):
+    return (pokemon.id, opponent.id, pokemon.current_hp, opponent.current_hp)
+
+
+def _lookup_move(pokemon, opponent):
+    """The move in the transposition table, or None."""
+    move_id = _transpositions.get(_transposition_key(pokemon, opponent))
+    if move_id is not None:
+        for move in _candidate_moves(pokemon):
+            if move.id == move_id:
+                return move
+    return None
+
+
+def _store_move(pokemon, opponent, move):
+    _transpositions[_transposition_key(pokemon, opponent)] = move.id
+
+
 def select_move(pokemon, opponent):
-    """Select a move for a Pokemon when facing a certain opponent (minimax)."""
+    """Select a move for a Pokemon when facing a certain opponent (minimax).
+
+    Notes:
+        The selected move only depends on the two pokemon and their HP, so it
+        is looked up in the transposition table before it is computed.
+    """
+    move = _lookup_move(pokemon, opponent)
+    if move is None:
+        move = _select_move(pokemon, opponent)
+        _store_move(pokemon, opponent, move)
+    return move
+
+
+def select_moves(pokemon, opponent):
+    """Select the moves of both pokemon for the next turn, same as select_move for each.
+
+    Notes:
+        The win probabilities of both sides are computed in one pass over the
+        pairs of moves, see _win_probabilities().
+    """
+    move = _lookup_move(pokemon, opponent)
+    opponent_move = _lookup_move(opponent, pokemon)
+    if move is None or opponent_move is None:
+        moves = _moves(pokemon, opponent)
+        opponent_moves = _moves(opponent, pokemon)
+        matrix = [
+            [_win_probabilities(pokemon, move, opponent, opponent_move) for opponent_move in opponent_moves]
+            for move in moves
+        ]
+        scores = [min(p_win for p_win, _p_lose in row) for row in matrix]
+        opponent_scores = [
+            min(row[j][1] for row in matrix) for j in range(len(opponent_moves))
+        ]
+        move = _best_move(pokemon, opponent, moves, scores)
+        opponent_move = _best_move(opponent, pokemon, opponent_moves, opponent_scores)
+        _store_move(pokemon, opponent, move)
+        _store_move(opponent, pokemon, opponent_move)
+    return move, opponent_move
+
+
+def _select_move(pokemon, opponent):
     moves = _moves(pokemon, opponent)
     opponent_moves = _moves(opponent, pokemon)
     scores = [_score(pokemon, move, opponent, opponent_moves) for move in moves]
-    best_moves = [move for move, score in zip(moves, scores) if score == max(scores)]
-    if max(scores) > 0.0:
+    return _best_move(pokemon, opponent, moves, scores)
+
+
+def _best_move(pokemon, opponent, moves, scores):
+    """The move with the highest score, ties are broken by the other properties of the moves."""
+    # Scores that differ less than TOLERANCE are rounding noise, consider them equal.
+    best_moves = [move for move, score in zip(moves, scores) if score >= max(scores) - TOLERANCE]
+    if max(scores) > TOLERANCE:
         recoils = [move.recoil for move in best_moves]
         best_moves = [move for move in best_moves if move.recoil == min(recoils)]
         expected_turns = [
-            ceil(opponent.current_hp / move.expected_damage(pokemon, opponent))
+            ceil(opponent.current_hp / _expected_damage(pokemon, move, opponent))
             for move in best_moves
         ]
         best_moves = [
@@ -85,7 +268,7 @@ def select_move(pokemon, opponent):
         best_moves = [move for move in best_moves if move.drain == max(drains)]
         accuracies = [move.accuracy for move in best_moves]
         best_moves = [move for move in best_moves if move.accuracy == max(accuracies)]
-    return max(best_moves, key=lambda move: move.expected_damage(pokemon, opponent))
+    return max(best_moves, key=lambda move: _expected_damage(pokemon, move, opponent))
 
 
 def _add_probability(distr, damage, probability):
@@ -99,15 +282,14 @@ def _damage_distribution(pokemon, move, opponent):
     distr = {}
     if not isclose(accuracy, 1.0):
         _add_probability(distr, 0, 1.0 - accuracy)
-    for random_number in range(85, 101):
-        damage = move.true_damage(pokemon, opponent, random_number)
+    for damage in _true_damages(pokemon, move, opponent):
         _add_probability(distr, damage, accuracy / 16.0)
     return distr
 
 
 def _opponent_recovery(pokemon, move, opponent, opponent_move, turns):
     """Expected recovery for the opponent."""
-    expected_damage = round(opponent_move.expected_damage(opponent, pokemon))
+    expected_damage = round(_expected_damage(opponent, opponent_move, pokemon))
     expected_recovery = opponent_move.drain_recovery(expected_damage)
     max_recovery = opponent_move.drain_recovery(pokemon.current_hp)
     if pokemon.first(move, opponent, opponent_move) == opponent:
@@ -149,9 +331,17 @@ def _sum_distribution(distr1, distr2):
     return distr
 
 
-MAX_TURNS = 10
+# Maximum number of turns that the AI looks ahead (the horizon of the faint
+# distributions). The faint distributions stop early when the opponent has
+# fainted with a probability of at least 1 - HORIZON_EPSILON, see _faint_cdf().
+MAX_TURNS = getattr(settings, 'AI_MAX_TURNS', 10)
+HORIZON_EPSILON = getattr(settings, 'AI_HORIZON_EPSILON', 1e-14)
 SURVIVAL = 999
 
+# Maximum absolute difference between the faint probabilities of the array
+# engine and the dict reference implementation (floating point summation order).
+TOLERANCE = 1e-12
+
 
 def _cumulative_damage_distributions(pokemon, move, opponent):
     """Probability distribution of the cumulative damage for multiple turns."""
@@ -162,27 +352,209 @@ def _cumulative_damage_distributions(pokemon, move, opponent):
     return distributions
 
 
-def _faint_distribution(pokemon, move, opponent, opponent_move, is_selecting):
-    """Probability distribution of the turn the opponent faints."""
-    distributions = _cumulative_damage_distributions(pokemon, move, opponent)
-    cdf = [
-        _faint_probability(
-            distr,
-            _opponent_hp(pokemon, move, opponent, opponent_move, turns, is_selecting)
-        )
-        for turns, distr in enumerate(distributions)
-    ]
-    pdf = [
-        probability - probability_previous
-        for probability, probability_previous in zip(cdf, [0.0] + cdf[:-1])
+def _damage_vector(pokemon, move, opponent):
+    """Damage distribution as a dense array (the index is the damage)."""
+    distr = _damage_distribution(pokemon, move, opponent)
+    vector = np.zeros(max(distr) + 1)
+    for damage, probability in distr.items():
+        vector[damage] += probability
+    return vector
+
+
+class _DamageTails:
+    """Tail probabilities of the cumulative damage, one row per turn.
+
+    The rows are computed on demand, so the convolutions for turns after the
+    opponent has fainted anyway are never done. Every row has a zero as the
+    last column, so damage values that cannot be reached can be looked up by
+    clipping them to the last column.
+    """
+
+    def __init__(self, vector):
+        self._vector = vector
+        self._cumulative = vector
+        self._rows = [self._tail(vector)]
+        _horizon_stats['tails'] += 1
+
+    @staticmethod
+    def _tail(vector):
+        tail = np.zeros(len(vector) + 1)
+        tail[:-1] = np.cumsum(vector[::-1])[::-1]
+        tail.flags.writeable = False
+        return tail
+
+    def row(self, turn):
+        """Probability that the damage after turn + 1 turns is at least the column index."""
+        if len(self._vector) == 1:
+            return self._rows[0]  # No damage, the distribution stays the same.
+        while len(self._rows) <= turn:
+            self._extend()
+        return self._rows[turn]
+
+    def _extend(self):
+        """Add the row of the next turn (one convolution)."""
+        self._cumulative = np.convolve(self._cumulative, self._vector)
+        self._rows.append(self._tail(self._cumulative))
+        _horizon_stats['convolutions'] += 1
+
+
+# Process-wide caches, keyed on database ids. The pokemon, moves and types are
+# assumed not to change during a run; clear_caches() is called when they do.
+_damage_tails_cache = LRUCache(getattr(settings, 'AI_DAMAGE_CACHE_SIZE', 1024))
+_faint_cache = LRUCache(getattr(settings, 'AI_FAINT_CACHE_SIZE', 65536))
+
+# Number of damage tails built, convolutions done and faint distributions that stopped early.
+_horizon_stats = {'tails': 0, 'convolutions': 0, 'early_exits': 0}
+
+
+def clear_caches():
+    """Empty the caches of the AI, e.g. after the pokemon data has changed."""
+    _damage_tails_cache.clear()
+    _faint_cache.clear()
+    _transpositions.clear()
+    for name in _horizon_stats:
+        _horizon_stats[name] = 0
+
+
+def cache_info():
+    """Hit and miss statistics of the caches of the AI."""
+    return {
+        'damage_tails': _damage_tails_cache.info(),
+        'faint_distribution': _faint_cache.info(),
+        'transpositions': _transpositions.info(),
+    }
+
+
+def horizon_info():
+    """Convolutions done and saved by the adaptive horizon, since clear_caches()."""
+    convolutions = _horizon_stats['convolutions']
+    return {
+        'convolutions': convolutions,
+        'convolutions_saved': _horizon_stats['tails'] * (MAX_TURNS - 1) - convolutions,
+        'early_exits': _horizon_stats['early_exits'],
+    }
+
+
+def _damage_tails(pokemon, move, opponent):
+    """The _DamageTails of a move. Independent of the HP, so it is cached."""
+    key = (pokemon.id, move.id, opponent.id)
+    tails = _damage_tails_cache.get(key)
+    if tails is None:
+        tails = _DamageTails(_damage_vector(pokemon, move, opponent))
+        _damage_tails_cache[key] = tails
+    return tails
+
+
+def _opponent_hps(pokemon, move, opponent, opponent_move, is_selecting):
+    """HP used to calculate the faint probability for every turn."""
+    return [
+        _opponent_hp(pokemon, move, opponent, opponent_move, turns, is_selecting)
+        for turns in range(MAX_TURNS)
     ]
-    faint_distr = {turn: probability for turn, probability in enumerate(pdf)}
-    faint_distr[SURVIVAL] = 1.0 - sum(pdf)   # probability of survival
+
+
+def _faint_cdf_reference(pokemon, move, opponent, opponent_move, is_selecting):
+    """Probability that the opponent has fainted after each turn (dict based)."""
+    distributions = _cumulative_damage_distributions(pokemon, move, opponent)
+    hps = _opponent_hps(pokemon, move, opponent, opponent_move, is_selecting)
+    return [_faint_probability(distr, hp) for distr, hp in zip(distributions, hps)]
+
+
+def _faint_cdf(pokemon, move, opponent, opponent_move, is_selecting, hps=None):
+    """Probability that the opponent has fainted after each turn.
+
+    Notes:
+        The cumulative damage only increases, so once the opponent has fainted
+        with a probability of at least 1 - HORIZON_EPSILON at its highest HP,
+        the later turns are 1.0 (and their convolutions are skipped). Equal to
+        _faint_cdf_reference within TOLERANCE.
+    """
+    tails = _damage_tails(pokemon, move, opponent)
+    if hps is None:
+        hps = _opponent_hps(pokemon, move, opponent, opponent_move, is_selecting)
+    max_hp = max(max(hps), 0)
+    cdf = []
+    for turn, hp in enumerate(hps):
+        row = tails.row(turn)
+        cdf.append(float(row[min(max(hp, 0), len(row) - 1)]))
+        if 1.0 - row[min(max_hp, len(row) - 1)] < HORIZON_EPSILON:
+            cdf.extend([1.0] * (len(hps) - len(cdf)))
+            _horizon_stats['early_exits'] += 1
+            break
+    return cdf
+
+
+def _faint_distribution(pokemon, move, opponent, opponent_move, is_selecting):
+    """Probability distribution of the turn the opponent faints.
+
+    Notes:
+        The result only depends on the damage distribution and the HP of the
+        opponent in each turn, so it is cached with those as the key.
+    """
+    hps = tuple(_opponent_hps(pokemon, move, opponent, opponent_move, is_selecting))
+    key = (pokemon.id, move.id, opponent.id, hps)
+    faint_distr = _faint_cache.get(key)
+    if faint_distr is None:
+        cdf = _faint_cdf(pokemon, move, opponent, opponent_move, is_selecting, hps)
+        pdf = [
+            probability - probability_previous
+            for probability, probability_previous in zip(cdf, [0.0] + cdf[:-1])
+        ]
+        faint_distr = {turn: probability for turn, probability in enumerate(pdf)}
+        faint_distr[SURVIVAL] = 1.0 - sum(pdf)   # probability of survival
+        _faint_cache[key] = faint_distr
     return faint_distr
 
 
 def win_probability(pokemon, move, opponent, opponent_move):
-    """Probability that the pokemon wins within the next couple of turns."""
+    """Probability that the pokemon wins within the next couple of turns.
+
+    Notes:
+        The pokemon wins if the opponent faints in an earlier turn, or in the
+        same turn when the pokemon moves first. One pass over the turns with
+        the probability that the pokemon faints later is enough. Equal to
+        _win_probability_reference within TOLERANCE.
+    """
+    first = pokemon.first(move, opponent, opponent_move)
+    if first is pokemon:
+        p_tie_win = 1.0
+    elif first is opponent:
+        p_tie_win = 0.0
+    else:
+        p_tie_win = 0.5
+    faint_opponent = _faint_distribution(pokemon, move, opponent, opponent_move, True)
+    faint_pokemon = _faint_distribution(opponent, opponent_move, pokemon, move, False)
+    p_win = 0.0
+    p_later = 1.0   # probability that the pokemon faints after this turn (or survives)
+    for turn in range(MAX_TURNS):
+        p_now = faint_pokemon[turn]
+        p_later -= p_now
+        p_win += faint_opponent[turn] * (p_later + p_tie_win * p_now)
+    return p_win
+
+
+def _win_probabilities(pokemon, move, opponent, opponent_move):
+    """Win probabilities of the pokemon and of the opponent, for both sides.
+
+    Notes:
+        Same as win_probability for (pokemon, move) and for (opponent,
+        opponent_move). The faint distributions only differ for moves with
+        recoil (the recoil is subtracted from the HP of the opponent that is
+        not selecting). Without recoil the opponent wins whenever the pokemon
+        does not win and the battle is decided within MAX_TURNS.
+    """
+    p_win = win_probability(pokemon, move, opponent, opponent_move)
+    if move.recoil > 0 or opponent_move.recoil > 0:
+        return p_win, win_probability(opponent, opponent_move, pokemon, move)
+    p_undecided = (
+        _faint_distribution(pokemon, move, opponent, opponent_move, True)[SURVIVAL] *
+        _faint_distribution(opponent, opponent_move, pokemon, move, False)[SURVIVAL]
+    )
+    return p_win, 1.0 - p_win - p_undecided
+
+
+def _win_probability_reference(pokemon, move, opponent, opponent_move):
+    """Probability that the pokemon wins (loop over all pairs of faint turns)."""
     first = pokemon.first(move, opponent, opponent_move)
     p_win = 0.0
     p_lose = 0.0
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class PokemonConfig(AppConfig):
     name = 'pokemon'
+
+    def ready(self):
+        from pokemon import signals  # noqa: F401 (connects the receivers)
@@ -0,0 +1,151 @@
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+import numpy as np
+from django.core import serializers
+
+from pokemon import ai, simulator
+from pokemon.models import Ability, BattleLog, Move, Nature, Pokemon, Species, Type
+from pokemon.models.pokemon import PokemonMixin
+from pokemon.snapshot import Snapshot
+
+FIXTURE = Path(__file__).resolve().parent / 'fixtures' / 'benchmark_roster.json'
+ROSTER_SIZE = 50
+PAIRS = 20    # Number of (fixed) pairs for the select_move and win_probability benchmarks.
+SEED = 0
+
+
+def make_fixture(path=FIXTURE, size=ROSTER_SIZE):
+    """Write a fixture with a fixed subset of the pokemon in the database.
+
+    The pokemon are spread evenly over the ids, e.g. derived from
+    db.sqlite3.init. All types, natures and species are included (the species
+    refer to each other), and only the moves and abilities that are used.
+    """
+    ids = list(Pokemon.objects.order_by('id').values_list('id', flat=True))
+    ids = ids[::max(len(ids) // size, 1)][:size]
+    pokemons = list(Pokemon.objects.filter(id__in=ids).order_by('id'))
+    for pokemon in pokemons:
+        pokemon.cache = {}
+    objects = (
+        list(Type.objects.order_by('id')) +
+        list(Nature.objects.order_by('id')) +
+        list(Ability.objects.filter(pokemon__in=ids).distinct().order_by('id')) +
+        list(Species.objects.order_by('id')) +
+        list(Move.objects.filter(pokemon__in=ids).distinct().order_by('id')) +
+        pokemons
+    )
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        serializers.serialize('json', objects, indent=1, stream=f)
+
+
+def _pairs(pokemons):
+    rng = random.Random(SEED)
+    return [tuple(rng.sample(pokemons, 2)) for _ in range(PAIRS)]
+
+
+def _select_move(snapshot):
+    for pokemon, opponent in _pairs(list(snapshot.pokemon.values())):
+        pokemon.current_hp, opponent.current_hp = pokemon.hp, opponent.hp
+        ai.select_move(pokemon, opponent)
+
+
+def _select_move_without_stat_block(snapshot):
+    """_select_move with the stats computed on every access, as before the StatBlock."""
+    stats = PokemonMixin.stats
+    PokemonMixin.stats = property(PokemonMixin._compute_stats)
+    try:
+        _select_move(snapshot)
+    finally:
+        PokemonMixin.stats = stats
+
+
+def _win_probability(snapshot):
+    for pokemon, opponent in _pairs(list(snapshot.pokemon.values())):
+        pokemon.current_hp, opponent.current_hp = pokemon.hp, opponent.hp
+        for move in ai._moves(pokemon, opponent):
+            for opponent_move in ai._moves(opponent, pokemon):
+                ai.win_probability(pokemon, move, opponent, opponent_move)
+
+
+def _battle(snapshot):
+    pokemon, opponent = _pairs(list(snapshot.pokemon.values()))[0]
+    pokemon.battle(opponent, rng=random.Random(SEED))
+
+
+def _round_robin(snapshot):
+    last = BattleLog.objects.order_by('id').last()
+    simulator.battle(seed=SEED, quiet=True, compact=True)
+    BattleLog.objects.filter(id__gt=last.id if last else 0).delete()
+
+
+# name -> function of a Snapshot, every run starts with empty AI caches.
+BENCHMARKS = {
+    'select_move': _select_move,
+    'select_move_without_stat_block': _select_move_without_stat_block,
+    'win_probability': _win_probability,
+    'battle': _battle,
+    'round_robin': _round_robin,
+}
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names=None, repeat=3):
+    """Run the benchmarks (all by default) on the pokemon in the database.
+
+    Returns a JSON-serializable dict with the durations in seconds and the
+    environment, so the results of different commits can be compared.
+    """
+    snapshot = Snapshot()
+    results = {}
+    for name in names or BENCHMARKS:
+        times = []
+        for _ in range(repeat):
+            ai.clear_caches()
+            start = time.perf_counter()
+            BENCHMARKS[name](snapshot)
+            times.append(time.perf_counter() - start)
+        results[name] = {
+            'times': times,
+            'best': min(times),
+            'median': statistics.median(times),
+        }
+    ai.clear_caches()
+    return {
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'numpy': np.__version__,
+        'pokemon': len(snapshot.pokemon),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def report(benchmark, baseline=None):
+    """Human-readable table, with the ratio to a baseline (an earlier result) if given."""
+    lines = [f"Benchmark of {benchmark['pokemon']} pokemon at commit {benchmark['commit']}:"]
+    for name, result in benchmark['results'].items():
+        line = f"{name:<30} best {result['best']:9.4f} s   median {result['median']:9.4f} s"
+        if baseline and name in baseline['results']:
+            ratio = result['median'] / baseline['results'][name]['median']
+            line += f"   {ratio:.2f}x the median of {baseline['commit']}"
+        lines.append(line)
+    return '\n'.join(lines)
@@ -0,0 +1,101 @@
+import dbm
+import shelve
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Mapping with a maximum size that evicts the least recently used entry.
+
+    Hits and misses of get() are counted, so the effectiveness of a cache can
+    be reported after a run.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        """Value for the key (marked as recently used) or the default."""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """Statistics of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+
+class TranspositionTable(LRUCache):
+    """LRU cache that can be saved to and loaded from a shelve file.
+
+    The keys are tuples of ints, the values must be picklable. The file also
+    holds a fingerprint of what the values depend on (e.g. the data versions),
+    entries saved with another fingerprint are never used.
+    """
+    FINGERPRINT = 'fingerprint'
+
+    @classmethod
+    def _fingerprint(cls, path):
+        """The fingerprint of a file, None if there is no file."""
+        try:
+            shelf = shelve.open(path, flag='r')
+        except dbm.error:
+            return None
+        with shelf:
+            return shelf.get(cls.FINGERPRINT)
+
+    def load(self, path, fingerprint):
+        """Add the entries of a file (if it exists), up to the maximum size.
+
+        Returns whether the file was used, a file saved with another
+        fingerprint is ignored.
+        """
+        if fingerprint is None or self._fingerprint(path) != fingerprint:
+            return False
+        with shelve.open(path, flag='r') as shelf:
+            for key, value in shelf.items():
+                if key != self.FINGERPRINT:
+                    self[tuple(int(i) for i in key.split(':'))] = value
+        return True
+
+    def save(self, path, fingerprint):
+        """Write all entries to a file, in addition to the entries already in it.
+
+        A file with another fingerprint is replaced.
+        """
+        flag = 'c' if self._fingerprint(path) == fingerprint else 'n'
+        with shelve.open(path, flag=flag) as shelf:
+            shelf[self.FINGERPRINT] = fingerprint
+            shelf.update((':'.join(str(i) for i in key), value) for key, value in self._data.items())
@@ -0,0 +1,95 @@
+import time
+
+import numpy as np
+
+from pokemon.ai import _usable_moves
+from pokemon.models.type import type_chart
+
+RANDOM_NUMBERS = range(85, 101)
+
+
+class DamageTable:
+    """Damage of every usable move of every attacker against every defender.
+
+    The damage is stored as one compact array with the shape (attacker moves,
+    defenders, random numbers). The rows are the (attacker, move) combinations,
+    so only moves that are actually learned take up memory. The values are the
+    same as Move.true_damage, but computed for the whole roster at once.
+    """
+
+    def __init__(self, damage, rows, columns, build_time):
+        self.damage = damage
+        self.rows = rows          # (pokemon id, move id) -> row index
+        self.columns = columns    # pokemon id -> column index
+        self.build_time = build_time
+
+    @property
+    def nbytes(self):
+        return self.damage.nbytes
+
+    def rolls(self, attacker, move, defender):
+        """Damage for the random numbers 85 to 100, None if not in the table."""
+        row = self.rows.get((attacker.id, move.id))
+        column = self.columns.get(defender.id)
+        if row is None or column is None:
+            return None
+        return self.damage[row, column].tolist()
+
+    def report(self):
+        rows, columns, random_numbers = self.damage.shape
+        return (
+            f'Damage table: {rows} attacker moves x {columns} defenders x '
+            f'{random_numbers} random numbers, {self.nbytes / 2**20:.1f} MiB, '
+            f'built in {self.build_time:.2f} s.'
+        )
+
+    @classmethod
+    def build(cls, pokemons):
+        """Compute the damage table for all combinations of the pokemon."""
+        start = time.perf_counter()
+        pokemons = list(pokemons)
+        type_index = type_chart().index
+        chart = np.array(type_chart().matrix)
+
+        # Attacker moves (rows):
+        rows = {}
+        level_factors, powers, attack_stats, move_types, stabs, physicals = [], [], [], [], [], []
+        for pokemon in pokemons:
+            species = pokemon.species
+            for move in _usable_moves(pokemon):
+                rows[(pokemon.id, move.id)] = len(rows)
+                physical = (move.damage_class == 'PH')
+                level_factors.append((2 * pokemon.level) // 5 + 2)
+                powers.append(round(move.nerf_factor * move.power))
+                attack_stats.append(pokemon.attack if physical else pokemon.special_attack)
+                move_types.append(type_index[move.type_id])
+                stabs.append(move.type_id in (species.type1_id, species.type2_id))
+                physicals.append(physical)
+        powers = np.array(powers, dtype=np.int64)
+        physicals = np.array(physicals)
+
+        # Defenders (columns):
+        columns = {pokemon.id: i for i, pokemon in enumerate(pokemons)}
+        defense = np.array([pokemon.defense for pokemon in pokemons], dtype=np.int64)
+        special_defense = np.array([pokemon.special_defense for pokemon in pokemons], dtype=np.int64)
+        type1 = np.array([type_index[pokemon.species.type1_id] for pokemon in pokemons])
+        type2 = np.array([
+            type_index.get(pokemon.species.type2_id, -1) for pokemon in pokemons
+        ])
+
+        # Same formulas as Move._damage_value and Move._apply_type:
+        move_types = np.array(move_types, dtype=np.int64)
+        effectiveness = chart[move_types][:, type1] * np.where(
+            type2 >= 0, chart[move_types][:, type2], 1.0
+        )
+        defense_stats = np.where(physicals[:, None], defense, special_defense)
+        attack = np.array(level_factors, dtype=np.int64) * powers * np.array(attack_stats, dtype=np.int64)
+        damage_value = (attack[:, None] // defense_stats) // 50 + 2
+        damage_value = np.where(powers[:, None] == 0, 0, np.maximum(damage_value, 1))
+        stabs = np.array(stabs)[:, None]
+        damage = np.empty((len(rows), len(columns), len(RANDOM_NUMBERS)), dtype=np.uint16)
+        for i, random_number in enumerate(RANDOM_NUMBERS):
+            value = damage_value * random_number // 100
+            value = np.where(stabs, (3 * value) // 2, value)
+            damage[:, :, i] = np.floor(effectiveness * value)
+        return cls(damage, rows, columns, time.perf_counter() - start)
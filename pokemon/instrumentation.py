@@ -0,0 +1,148 @@
+import functools
+import importlib
+import json
+import random
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+# Functions that are counted and timed: (phase, module, attribute).
+TARGETS = (
+    ('snapshot', 'pokemon.snapshot', 'Snapshot.__init__'),
+    ('damage_table', 'pokemon.damage_table', 'DamageTable.build'),
+    ('select_move', 'pokemon.ai', 'select_move'),
+    ('select_moves', 'pokemon.ai', 'select_moves'),
+    ('_moves', 'pokemon.ai', '_moves'),
+    ('win_probability', 'pokemon.ai', 'win_probability'),
+    ('convolution', 'pokemon.ai', '_DamageTails._extend'),
+    ('battlelog_write', 'pokemon.simulator', 'BattleLogWriter.flush'),
+)
+
+SAMPLE_SIZE = 10000     # Number of durations per phase that are kept for the percentiles.
+PERCENTILES = (50, 90, 99)
+
+
+class Phase:
+    """Number of calls and total duration, with a random sample of the durations."""
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.sample = []
+        self._random = random.Random(0)   # Do not touch the global random state.
+
+    def add(self, seconds):
+        self.calls += 1
+        self.seconds += seconds
+        if len(self.sample) < SAMPLE_SIZE:
+            self.sample.append(seconds)
+        else:
+            i = self._random.randrange(self.calls)
+            if i < SAMPLE_SIZE:
+                self.sample[i] = seconds
+
+    def summary(self):
+        sample = sorted(self.sample)
+        summary = {'calls': self.calls, 'seconds': self.seconds}
+        for percentile in PERCENTILES:
+            index = round(percentile / 100 * (len(sample) - 1))
+            summary[f'p{percentile}_ms'] = 1000 * sample[index] if sample else None
+        summary['max_ms'] = 1000 * sample[-1] if sample else None
+        return summary
+
+
+def _resolve(module_name, attribute):
+    """The object that has the attribute (module or class) and the attribute name."""
+    owner = importlib.import_module(module_name)
+    *path, name = attribute.split('.')
+    for part in path:
+        owner = getattr(owner, part)
+    return owner, name
+
+
+class Instrumentation:
+    """Counters and timers for the hot paths of the simulator and the AI.
+
+    While active(), the functions in TARGETS are replaced by timed wrappers
+    and the ORM queries are timed with a database execute wrapper, so there is
+    no overhead at all when it is not used. The durations are inclusive (e.g.
+    select_moves includes _moves). Only the current process is measured, the
+    worker processes of a parallel run are not.
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    def _phase(self, name):
+        return self.phases.setdefault(name, Phase())
+
+    def _timed(self, name, function):
+        phase = self._phase(name)
+        perf_counter = time.perf_counter
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                phase.add(perf_counter() - start)
+        return wrapper
+
+    def _query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self._phase('orm_query').add(time.perf_counter() - start)
+
+    @contextmanager
+    def active(self):
+        originals = []
+        try:
+            for name, module_name, attribute in TARGETS:
+                owner, attribute_name = _resolve(module_name, attribute)
+                originals.append((owner, attribute_name, vars(owner)[attribute_name]))
+                setattr(owner, attribute_name, self._timed(name, getattr(owner, attribute_name)))
+            with connection.execute_wrapper(self._query):
+                yield self
+        finally:
+            for owner, attribute_name, original in reversed(originals):
+                setattr(owner, attribute_name, original)
+
+    def summary(self, battles, seconds):
+        """Summary of a run (JSON serializable)."""
+        return {
+            'battles': battles,
+            'seconds': seconds,
+            'battles_per_second': battles / seconds if seconds else None,
+            'phases': {name: phase.summary() for name, phase in self.phases.items()},
+        }
+
+
+def _ms(value):
+    return '-' if value is None else f'{value:.3f}'
+
+
+def report(summary):
+    """Human-readable report of a summary."""
+    lines = [
+        f"{summary['battles']} battles in {summary['seconds']:.1f} s "
+        f"({summary['battles_per_second'] or 0:.1f} battles/s).",
+        f"{'phase':<16} {'calls':>10} {'total s':>9} {'share':>6} "
+        + ' '.join(f'{f"p{percentile} ms":>9}' for percentile in PERCENTILES) + f" {'max ms':>9}",
+    ]
+    phases = [(name, phase) for name, phase in summary['phases'].items() if phase['calls']]
+    for name, phase in sorted(phases, key=lambda item: -item[1]['seconds']):
+        share = phase['seconds'] / summary['seconds'] if summary['seconds'] else 0.0
+        lines.append(
+            f"{name:<16} {phase['calls']:>10} {phase['seconds']:>9.3f} {share:>6.1%} "
+            + ' '.join(f"{_ms(phase[f'p{percentile}_ms']):>9}" for percentile in PERCENTILES)
+            + f" {_ms(phase['max_ms']):>9}"
+        )
+    return '\n'.join(lines)
+
+
+def to_json(summary):
+    return json.dumps(summary, indent=2)
@@ -1,19 +1,30 @@
-import pokebase as pb
-from pokemon.models import Nature, Type, Species, Ability, Move, Pokemon
+import time
+from contextlib import contextmanager
 
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
 
-def get_all(attr, max_id=None):
-    """Generator: retrieve all objects of Pokemon API."""
-    i = 1
-    while True:
-        try:
-            print(i)
-            yield getattr(pb, attr)(i)
-        except:
-            return
-        if max_id and i >= max_id:
-            return
-        i += 1
+from pokemon import ai
+from pokemon.models import Nature, Type, Species, Ability, Move, Pokemon, DataVersion
+from pokemon.models.type import type_chart
+from pokemon.pokeapi import PokeAPI, resource_id
+
+MAX_SPECIES_ID = 386    # up to 3rd gen only
+
+
+@contextmanager
+def stage(name):
+    """Print the number of queries and the time of a stage of the load."""
+    start = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        yield
+    print(f'{name}: {len(queries)} queries in {time.perf_counter() - start:.2f} s')
+
+
+def _ids(model):
+    """{name: id} of all instances of a model (one query)."""
+    return dict(model.objects.values_list('name', 'id'))
 
 
 def get_increased_stat(nature):
@@ -32,32 +43,37 @@ def get_decreased_stat(nature):
         return ''
 
 
-def load_natures():
+def load_natures(api):
     """Load all natures from Pokemon API into the our own DB."""
-    for nature in get_all('nature'):
-        name = nature.name
-        increased_stat = get_increased_stat(nature)
-        decreased_stat = get_decreased_stat(nature)
-        Nature.objects.create(name=name, increased_stat=increased_stat, decreased_stat=decreased_stat)
+    Nature.objects.bulk_create(
+        Nature(name=nature.name, increased_stat=get_increased_stat(nature), decreased_stat=get_decreased_stat(nature))
+        for nature in api.get_all('nature')
+    )
 
 
-def load_types():
+def load_types(api):
     """Load all types from Pokemon API into the our own DB."""
-    for type_ in get_all('type_'):
-        name = type_.name
-        instance, _created = Type.objects.get_or_create(name=name)
-        for other_type in type_.damage_relations.double_damage_from:
-            other_name = other_type.name
-            other_instance, _created = Type.objects.get_or_create(name=other_name)
-            instance.weaknesses.add(other_instance)
-        for other_type in type_.damage_relations.half_damage_from:
-            other_name = other_type.name
-            other_instance, _created = Type.objects.get_or_create(name=other_name)
-            instance.resistances.add(other_instance)
-        for other_type in type_.damage_relations.no_damage_from:
-            other_name = other_type.name
-            other_instance, _created = Type.objects.get_or_create(name=other_name)
-            instance.immunities.add(other_instance)
+    types = api.get_all('type')
+    relations = {
+        'weaknesses': 'double_damage_from',
+        'resistances': 'half_damage_from',
+        'immunities': 'no_damage_from'
+    }
+    names = []
+    for type_ in types:
+        names.append(type_.name)
+        for relation in relations.values():
+            names.extend(other_type.name for other_type in getattr(type_.damage_relations, relation))
+    type_ids = _ids(Type)
+    Type.objects.bulk_create(Type(name=name) for name in dict.fromkeys(names) if name not in type_ids)
+    type_ids = _ids(Type)
+    for attribute, relation in relations.items():
+        through = getattr(Type, attribute).through
+        through.objects.bulk_create([
+            through(from_type_id=type_ids[type_.name], to_type_id=type_ids[other_type.name])
+            for type_ in types
+            for other_type in getattr(type_.damage_relations, relation)
+        ], ignore_conflicts=True)
 
 
 def _get_base_stat(stats, name):
@@ -65,51 +81,40 @@ def _get_base_stat(stats, name):
     return next(stat.base_stat for stat in stats if stat.stat.name == name)
 
 
-def load_species():
+def load_species(api):
     """Load all species from Pokemon API into the our own DB."""
-    max_id = 386    # up to 3rd gen only
-    for pokemon in get_all('pokemon', max_id=max_id):
-        id_ = pokemon.id
-        name = pokemon.name
-        hp = _get_base_stat(pokemon.stats, 'hp')
-        attack = _get_base_stat(pokemon.stats, 'attack')
-        defense = _get_base_stat(pokemon.stats, 'defense')
-        special_attack = _get_base_stat(pokemon.stats, 'special-attack')
-        special_defense = _get_base_stat(pokemon.stats, 'special-defense')
-        speed = _get_base_stat(pokemon.stats, 'speed')
-        type1 = Type.objects.get(name=pokemon.types[0].type.name)
-        if len(pokemon.types) > 1:
-            type2 = Type.objects.get(name=pokemon.types[1].type.name)
-        else:
-            type2 = None
-        Species.objects.create(
-            id=id_,
-            name=name,
-            type1=type1,
-            type2=type2,
-            hp=hp,
-            attack=attack,
-            defense=defense,
-            special_attack=special_attack,
-            special_defense=special_defense,
-            speed=speed
-        )
-    for pokemon in get_all('pokemon', max_id=max_id):
-        evolves_from = pokemon.species.evolves_from_species
+    type_ids = _ids(Type)
+    all_species = []
+    for pokemon in api.get_all('pokemon', max_id=MAX_SPECIES_ID):
+        all_species.append(Species(
+            id=pokemon.id,
+            name=pokemon.name,
+            type1_id=type_ids[pokemon.types[0].type.name],
+            type2_id=type_ids[pokemon.types[1].type.name] if len(pokemon.types) > 1 else None,
+            hp=_get_base_stat(pokemon.stats, 'hp'),
+            attack=_get_base_stat(pokemon.stats, 'attack'),
+            defense=_get_base_stat(pokemon.stats, 'defense'),
+            special_attack=_get_base_stat(pokemon.stats, 'special-attack'),
+            special_defense=_get_base_stat(pokemon.stats, 'special-defense'),
+            speed=_get_base_stat(pokemon.stats, 'speed')
+        ))
+    Species.objects.bulk_create(all_species)
+    species_ids = {species.id for species in all_species}
+    evolutions = []
+    for species in api.get_all('pokemon-species', max_id=MAX_SPECIES_ID):
+        evolves_from = species.evolves_from_species
         if evolves_from:
-            try:
-                species = Species.objects.get(name=pokemon.name)
-                species.evolves_from = Species.objects.get(name=evolves_from.name)
-                species.save()
-            except Species.DoesNotExist:
-                print(f'DoesNotExist: {pokemon.name}, {evolves_from.name}')
+            evolves_from_id = resource_id(evolves_from.url)
+            if species.id in species_ids and evolves_from_id in species_ids:
+                evolutions.append(Species(id=species.id, evolves_from_id=evolves_from_id))
+            else:
+                print(f'DoesNotExist: {species.name}, {evolves_from.name}')
+    Species.objects.bulk_update(evolutions, ['evolves_from'], batch_size=500)
 
 
-def load_abilities():
+def load_abilities(api):
     """Load all abilities from Pokemon API into our own DB."""
-    for ability in get_all('ability'):
-        name = ability.name
-        Ability.objects.create(name=name)
+    Ability.objects.bulk_create(Ability(name=ability.name) for ability in api.get_all('ability'))
 
 
 def _is_noteworthy(move):
@@ -186,18 +191,19 @@ def _is_noteworthy(move):
     return False
 
 
-def load_moves():
+def load_moves(api):
     """Load all moves from Pokemon API into our own DB."""
-    for move in get_all('move'):
+    type_ids = _ids(Type)
+    damage_classes = {
+        'physical': Move.DamageClass.PHYSICAL,
+        'special': Move.DamageClass.SPECIAL,
+        'status': Move.DamageClass.STATUS
+    }
+    moves = []
+    for move in api.get_all('move'):
         power = move.power if move.power else 0
         accuracy = move.accuracy if move.accuracy else 100
         pp = move.pp if move.pp else 5
-        type_ = Type.objects.get(name=move.type.name)
-        damage_classes = {
-            'physical': Move.DamageClass.PHYSICAL,
-            'special': Move.DamageClass.SPECIAL,
-            'status': Move.DamageClass.STATUS
-        }
         if move.damage_class:
             damage_class = damage_classes[move.damage_class.name]
         else:
@@ -205,18 +211,19 @@ def load_moves():
         drain = max(move.meta.drain, 0) if move.meta else 0
         recoil = max(-move.meta.drain, 0) if move.meta else 0
         is_noteworthy = _is_noteworthy(move)
-        Move.objects.create(
+        moves.append(Move(
             name=move.name,
             power=power,
             priority=move.priority,
             accuracy=accuracy,
             pp=pp,
-            type=type_,
+            type_id=type_ids[move.type.name],
             damage_class=damage_class,
             drain=drain,
             recoil=recoil,
             is_noteworthy=is_noteworthy
-        )
+        ))
+    Move.objects.bulk_create(moves, batch_size=500)
 
 
 def is_selected(move):
@@ -229,35 +236,86 @@ def is_selected(move):
     return False
 
 
-def load_pokemon():
+def load_pokemon(api):
     """Load unique Pokemon creatures for the battle simulator """
     ability = Ability.objects.first()
     nature = Nature.objects.get(name='quirky')
-    for species in Species.objects.all():
-        pokemon = Pokemon.objects.create(species=species, ability=ability, nature=nature)
-        for move in pb.pokemon(species.name).moves:
-            if is_selected(move):
-                move_name = move.move.name
-                pokemon.moves.add(Move.objects.get(name=move_name))
-
-
-def _pre_evolution_moves(pokemon):
-    evolves_from = pokemon.species.evolves_from
-    if evolves_from:
-        pokemon = Pokemon.objects.get(species=evolves_from)
-        pre_evolution_moves = _pre_evolution_moves(pokemon)
-        return list(pokemon.moves.all()) + pre_evolution_moves
-    else:
-        return []
+    move_ids = _ids(Move)
+    species_ids = list(Species.objects.order_by('id').values_list('id', flat=True))
+    # Same resources as in load_species, so these are served from the cache.
+    api_pokemon = api.get_many('pokemon', species_ids)
+    # Explicit ids, bulk_create does not return them on every database.
+    next_id = (Pokemon.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+    pokemons = []
+    pokemon_moves = []
+    for species_id, api_pokemon in zip(species_ids, api_pokemon):
+        pokemon = Pokemon(id=next_id, species_id=species_id, ability=ability, nature=nature)
+        next_id += 1
+        pokemons.append(pokemon)
+        move_names = dict.fromkeys(move.move.name for move in api_pokemon.moves if is_selected(move))
+        pokemon_moves.extend(
+            Pokemon.moves.through(pokemon_id=pokemon.id, move_id=move_ids[move_name]) for move_name in move_names)
+    Pokemon.objects.bulk_create(pokemons, batch_size=500)
+    Pokemon.moves.through.objects.bulk_create(pokemon_moves, batch_size=500)
+
+
+def pre_evolutions(evolves_from):
+    """All (transitive) pre-evolutions of every species.
+
+    Computed from {species id: id of the species it evolves from}, without
+    recursion, so the length of the evolution chains is not limited. Every
+    chain is walked once, a cycle in the data raises a ValueError.
+    """
+    closure = {}
+    for species_id in evolves_from:
+        chain = []
+        current = species_id
+        while current is not None and current not in closure:
+            if current in chain:
+                raise ValueError(f'Evolution cycle at species {current}')
+            chain.append(current)
+            current = evolves_from.get(current)
+        ancestors = set() if current is None else closure[current] | {current}
+        for descendant in reversed(chain):
+            closure[descendant] = ancestors
+            ancestors = ancestors | {descendant}
+    return closure
+
+
+def inherit_pre_evolution_moves():
+    """Add the moves of all pre-evolutions to the pokemon (four queries).
+
+    The movesets are united in memory, only the missing rows are inserted.
+    Returns the number of added moves.
+    """
+    evolves_from = dict(Species.objects.values_list('id', 'evolves_from_id'))
+    pokemon_species = dict(Pokemon.objects.values_list('id', 'species_id'))
+    moves = {pokemon_id: set() for pokemon_id in pokemon_species}
+    for pokemon_id, move_id in Pokemon.moves.through.objects.values_list('pokemon_id', 'move_id'):
+        moves[pokemon_id].add(move_id)
+    species_moves = {}
+    for pokemon_id, species_id in pokemon_species.items():
+        species_moves.setdefault(species_id, set()).update(moves[pokemon_id])
+    closure = pre_evolutions(evolves_from)
+    missing = [
+        Pokemon.moves.through(pokemon_id=pokemon_id, move_id=move_id)
+        for pokemon_id, species_id in pokemon_species.items()
+        for move_id in sorted(set().union(*(
+            species_moves.get(ancestor, set()) for ancestor in closure.get(species_id, ())
+        )) - moves[pokemon_id])
+    ]
+    Pokemon.moves.through.objects.bulk_create(missing, batch_size=500)
+    return len(missing)
 
 
 def apply_corrections():
     struggle = Move.objects.get(name='struggle')
-    for pokemon in Pokemon.objects.all():
-        pokemon.moves.add(struggle)  # Avoids problems with 0 damage moves.
-    for move in Move.objects.filter(name__in=['explosion', 'self-destruct']):
-        move.recoil = 10000  # Probably kills the Pokemon using the move.
-        move.save()
+    Pokemon.moves.through.objects.bulk_create([  # Avoids problems with 0 damage moves.
+        Pokemon.moves.through(pokemon_id=pokemon_id, move_id=struggle.id)
+        for pokemon_id in Pokemon.objects.values_list('id', flat=True)
+    ], batch_size=500, ignore_conflicts=True)
+    # Probably kills the Pokemon using the move.
+    Move.objects.filter(name__in=['explosion', 'self-destruct']).update(recoil=10000)
     nerf_factors = {
         'dream-eater': 0.0,
         'fake-out': 0.0,
@@ -285,22 +343,31 @@ def apply_corrections():
         'superpower': 0.875,
         'close-combat': 0.875
     }
-    for move in Move.objects.filter(name__in=nerf_factors.keys()):
+    moves = list(Move.objects.filter(name__in=nerf_factors.keys()))
+    for move in moves:
         move.nerf_factor = nerf_factors[move.name]
-        move.save()
-    for pokemon in Pokemon.objects.all():
-        moves = pokemon.moves.all()
-        for move in _pre_evolution_moves(pokemon):
-            if move not in moves:
-                pokemon.moves.add(move)
-
-
-def load_all():
-    """Load all the data at once."""
-    load_natures()
-    load_types()
-    load_abilities()
-    load_moves()
-    load_species()
-    load_pokemon()
-    apply_corrections()
+    Move.objects.bulk_update(moves, ['nerf_factor'])
+    inherit_pre_evolution_moves()
+
+
+def load_all(api=None):
+    """Load all the data at once, in one transaction.
+
+    The responses of the Pokemon API are cached on disk (see pokemon.pokeapi),
+    so a rerun or a partial load does not download them again. The loaders
+    write with bulk queries; the number of queries and the time of every
+    stage are printed.
+    """
+    api = api or PokeAPI()
+    with transaction.atomic():
+        for load in [load_natures, load_types, load_abilities, load_moves, load_species, load_pokemon]:
+            with stage(load.__name__):
+                load(api)
+        with stage('apply_corrections'):
+            apply_corrections()
+        # The bulk queries do not send the signals that clear the caches. The new
+        # versions also invalidate the saved transposition tables of the AI.
+        ai.clear_caches()
+        type_chart.cache_clear()
+        for name in ['moves', 'species', 'pokemon', 'types']:
+            DataVersion.bump(name)
@@ -0,0 +1,50 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from pokemon import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Time the AI and the simulator on the fixed benchmark roster (in a temporary database).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'benchmarks', nargs='*',
+            help=f"Benchmarks to run: {', '.join(benchmark.BENCHMARKS)} (default: all).")
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Number of runs of every benchmark.')
+        parser.add_argument(
+            '--output', default='benchmark.json',
+            help='File to write the results to (JSON).')
+        parser.add_argument(
+            '--compare',
+            help='Results of an earlier run (JSON) to compare with.')
+        parser.add_argument(
+            '--make-fixture', action='store_true',
+            help='Write the benchmark roster from the current database instead (e.g. db.sqlite3.init).')
+
+    def handle(self, *args, **options):
+        if options['make_fixture']:
+            benchmark.make_fixture()
+            self.stdout.write(f'Wrote {benchmark.FIXTURE}.')
+            return
+        unknown = set(options['benchmarks']) - set(benchmark.BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}.")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command('loaddata', str(benchmark.FIXTURE), verbosity=0)
+            results = benchmark.run(options['benchmarks'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+        self.stdout.write(benchmark.report(results, baseline))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from pokemon import pokemon_cache
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stale entries of Pokemon.cache of all pokemon (shown in the admin).'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            updated = pokemon_cache.recompute()
+        self.stdout.write(
+            f'Updated {updated} pokemon with {len(queries)} queries in {time.perf_counter() - start:.2f} s.')
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pokemon import simulator
+from pokemon.models import Tournament
+
+
+class Command(BaseCommand):
+    help = 'Store the BattleTurns of compact BattleLogs by replaying the battles from their seeds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tournament', type=int,
+            help='Only replay the battles of this tournament (id).')
+
+    def handle(self, *args, **options):
+        tournament = None
+        if options['tournament'] is not None:
+            tournament = Tournament.objects.filter(pk=options['tournament']).first()
+            if tournament is None:
+                raise CommandError(f"Tournament {options['tournament']} does not exist.")
+        start = time.perf_counter()
+        replayed = simulator.replay_battle_turns(tournament)
+        self.stdout.write(f'Replayed {replayed} battles in {time.perf_counter() - start:.1f} s.')
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pokemon import swiss
+from pokemon.models import Pokemon
+
+
+class Command(BaseCommand):
+    help = 'Rank the pokemon with Swiss rounds and Bradley-Terry ratings, instead of a full round-robin.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-error', type=float, default=100.0,
+            help='Stop when a --coverage fraction of the ratings is known within this number of Elo points '
+                 '(95%% confidence).')
+        parser.add_argument(
+            '--coverage', type=float, default=0.95,
+            help='Fraction of the ratings that must be known within --max-error.')
+        parser.add_argument(
+            '--max-rounds', type=int, default=200,
+            help='Stop after this number of rounds.')
+        parser.add_argument(
+            '--seed', type=int,
+            help='Seed every battle, so the run can be reproduced.')
+        parser.add_argument(
+            '--top', type=int, default=20,
+            help='Number of pokemon of the ranking to print.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        model = swiss.swiss_tournament(
+            max_error=options['max_error'],
+            coverage=options['coverage'],
+            max_rounds=options['max_rounds'],
+            seed=options['seed'],
+        )
+        elapsed = time.perf_counter() - start
+        names = dict(Pokemon.objects.values_list('id', 'species__name'))
+        for rank, (id, rating, error) in enumerate(model.ranking()[:options['top']], 1):
+            self.stdout.write(f'{rank:>4}. {names[id]:<16} {rating:7.0f} +- {error:.0f}')
+        n = len(model.ids)
+        self.stdout.write(
+            f'{model.battles} battles in {elapsed:.1f} s, '
+            f'{model.battles / (n * (n - 1)):.1%} of a full round-robin.')
@@ -0,0 +1,70 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from pokemon import ai, instrumentation, simulator
+from pokemon.models import BattleLog
+
+
+class Command(BaseCommand):
+    help = 'Let every pokemon battle every other pokemon and store the BattleLogs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of worker processes that run the battles.')
+        parser.add_argument(
+            '--seed', type=int,
+            help='Seed every battle, so the run can be reproduced.')
+        parser.add_argument(
+            '--damage-table', action='store_true',
+            help='Precompute the damage of all moves (uses more memory).')
+        parser.add_argument(
+            '--flush-battles', type=int, default=1000,
+            help='Store the BattleLogs after this number of battles.')
+        parser.add_argument(
+            '--flush-seconds', type=float, default=10.0,
+            help='Store the BattleLogs after this number of seconds.')
+        parser.add_argument(
+            '--quiet', action='store_true',
+            help='Do not print the battle reports.')
+        parser.add_argument(
+            '--compact', action='store_true',
+            help='Only store the seed and the outcome of the battles, not the reports and the '
+                 'BattleTurns (see replay_battle_turns).')
+        parser.add_argument(
+            '--summary-json',
+            help='Write the instrumentation summary to this file (requires SIMULATOR_INSTRUMENTATION).')
+
+    def handle(self, *args, **options):
+        if options['summary_json'] and not settings.SIMULATOR_INSTRUMENTATION:
+            raise CommandError('--summary-json requires the SIMULATOR_INSTRUMENTATION setting.')
+        if options['workers'] > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('--workers > 1 requires the fork start method')   # The workers share the snapshot.
+        battles = BattleLog.objects.count()
+        start = time.perf_counter()
+        summary = simulator.battle(
+            damage_table=options['damage_table'],
+            seed=options['seed'],
+            workers=options['workers'],
+            flush_battles=options['flush_battles'],
+            flush_seconds=options['flush_seconds'],
+            quiet=options['quiet'],
+            compact=options['compact'],
+        )
+        battles = BattleLog.objects.count() - battles
+        if options['summary_json']:
+            with open(options['summary_json'], 'w') as f:
+                f.write(instrumentation.to_json(summary))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{battles} battles in {elapsed:.1f} s ({battles / elapsed:.1f} battles/s).')
+        if options['workers'] == 1:
+            for name, info in ai.cache_info().items():
+                self.stdout.write(
+                    f"{name}: {info['hit_rate']:.1%} hit rate, {info['size']}/{info['maxsize']} entries.")
+            horizon = ai.horizon_info()
+            self.stdout.write(
+                f"Adaptive horizon: {horizon['convolutions']} convolutions, "
+                f"{horizon['convolutions_saved']} saved.")
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pokemon import montecarlo
+
+
+class Command(BaseCommand):
+    help = 'Repeat the battle of every matchup until its win rate is known within a precision.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--precision', type=float, default=0.05,
+            help='Half-width of the 95%% confidence interval of the win rates.')
+        parser.add_argument(
+            '--max-battles', type=int, default=1000,
+            help='Maximum number of battles per matchup.')
+        parser.add_argument(
+            '--seed', type=int,
+            help='Seed every battle, so the run can be reproduced.')
+        parser.add_argument(
+            '--save-every', type=int, default=1000,
+            help='Save the counts every this many matchups, an interrupted run continues from them.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        battles = montecarlo.sample_matchups(
+            precision=options['precision'],
+            max_battles=options['max_battles'],
+            seed=options['seed'],
+            save_every=options['save_every'],
+        )
+        self.stdout.write(f'{battles} battles in {time.perf_counter() - start:.1f} s.')
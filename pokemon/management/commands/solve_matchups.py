@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pokemon import solver
+
+
+class Command(BaseCommand):
+    help = 'Compute the exact win probability of every matchup and store it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--save-every', type=int, default=1000,
+            help='Save the win probabilities every this many matchups.')
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Skip the matchups that were solved by an earlier (interrupted) run.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        solved = solver.solve_matchups(save_every=options['save_every'], resume=options['resume'])
+        self.stdout.write(f'Solved {solved} matchups in {time.perf_counter() - start:.1f} s.')
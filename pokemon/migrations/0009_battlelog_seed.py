@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0008_pokemon_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='battlelog',
+            name='challenger_won',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='battlelog',
+            name='hp_left',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='battlelog',
+            name='seed',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='battlelog',
+            name='turns',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='battlelog',
+            name='report',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0009_battlelog_seed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Matchup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('win_probability', models.FloatField(blank=True, null=True)),
+                ('opponent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pokemon.pokemon')),
+                ('pokemon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matchups', to='pokemon.pokemon')),
+            ],
+            options={
+                'unique_together': {('pokemon', 'opponent')},
+            },
+        ),
+    ]
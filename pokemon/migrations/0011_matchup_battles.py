@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0010_matchup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchup',
+            name='battles',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='matchup',
+            name='wins',
+            field=models.IntegerField(default=0),
+        ),
+    ]
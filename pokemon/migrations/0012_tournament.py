@@ -0,0 +1,73 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:37
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def create_records(apps, schema_editor):
+    """Put the existing BattleLogs in one tournament and compute its records."""
+    BattleLog = apps.get_model('pokemon', 'BattleLog')
+    Tournament = apps.get_model('pokemon', 'Tournament')
+    PokemonRecord = apps.get_model('pokemon', 'PokemonRecord')
+    if not BattleLog.objects.exists():
+        return
+    tournament = Tournament.objects.create()
+    BattleLog.objects.update(tournament=tournament)
+    records = {}
+    wins = BattleLog.objects.values('winner').annotate(n=Count('id'), hp_left=Sum('hp_left'))
+    for row in wins:
+        records[row['winner']] = PokemonRecord(
+            tournament=tournament, pokemon_id=row['winner'], wins=row['n'], hp_left=row['hp_left'] or 0)
+    for row in BattleLog.objects.values('loser').annotate(n=Count('id')):
+        record = records.setdefault(
+            row['loser'], PokemonRecord(tournament=tournament, pokemon_id=row['loser']))
+        record.losses = row['n']
+    for record in records.values():
+        record.win_percentage = round(record.wins / (record.wins + record.losses) * 100, 2)
+    PokemonRecord.objects.bulk_create(records.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0011_matchup_battles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tournament',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('RR', 'round-robin'), ('SW', 'swiss')], default='RR', max_length=2)),
+                ('seed', models.BigIntegerField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PokemonRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('wins', models.IntegerField(default=0)),
+                ('losses', models.IntegerField(default=0)),
+                ('hp_left', models.IntegerField(default=0)),
+                ('win_percentage', models.FloatField(default=0.0)),
+                ('pokemon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='records', to='pokemon.pokemon')),
+                ('tournament', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='records', to='pokemon.tournament')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='battlelog',
+            name='tournament',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='battle_logs', to='pokemon.tournament'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemonrecord',
+            index=models.Index(fields=['tournament', '-win_percentage'], name='pokemon_pok_tournam_4c0386_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pokemonrecord',
+            unique_together={('tournament', 'pokemon')},
+        ),
+        migrations.RunPython(create_records, migrations.RunPython.noop),
+    ]
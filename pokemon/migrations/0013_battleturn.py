@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0012_tournament'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BattleTurn',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.SmallIntegerField()),
+                ('damage', models.IntegerField()),
+                ('hp_left', models.IntegerField()),
+                ('attacker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pokemon.pokemon')),
+                ('battle_log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='battle_turns', to='pokemon.battlelog')),
+                ('move', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pokemon.move')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='battleturn',
+            index=models.Index(fields=['attacker', 'move'], name='pokemon_bat_attacke_e7cd9a_idx'),
+        ),
+    ]
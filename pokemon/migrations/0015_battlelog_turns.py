@@ -0,0 +1,19 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def count_turns(apps, schema_editor):
+    """The turns field held the number of moves, a turn has two moves (except the last)."""
+    BattleLog = apps.get_model('pokemon', 'BattleLog')
+    BattleLog.objects.filter(turns__isnull=False).update(turns=(F('turns') + 1) / 2)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0014_dataversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_turns, migrations.RunPython.noop),
+    ]
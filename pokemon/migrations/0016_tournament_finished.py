@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:57
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def finish_tournaments(apps, schema_editor):
+    """The existing tournaments cannot be checked, assume that they were finished."""
+    Tournament = apps.get_model('pokemon', 'Tournament')
+    Tournament.objects.update(finished=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0015_battlelog_turns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tournament',
+            name='finished',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(finish_tournaments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+import re
+
+from django.db import migrations
+
+# A move in a battle report, see Pokemon.use_move.
+MOVE = re.compile(
+    r'^(?P<attacker>\S+) uses (?P<move>\S+) with (?P<damage>\d+) \w+ damage\.\n'
+    r'HP left: \S+ \(\d+\) and \S+ \((?P<hp_left>\d+)\)\.$',
+    re.MULTILINE
+)
+
+
+def parse_report(report, pokemon_ids, move_ids):
+    """(number, attacker id, move id, damage, HP left) of the moves in a report.
+
+    pokemon_ids are the ids of the two pokemon by name. None if the report
+    cannot be attributed (unknown names).
+    """
+    rows = []
+    for number, match in enumerate(MOVE.finditer(report), 1):
+        attacker_id = pokemon_ids.get(match['attacker'])
+        move_id = move_ids.get(match['move'])
+        if attacker_id is None or move_id is None:
+            return None
+        rows.append((number, attacker_id, move_id, int(match['damage']), int(match['hp_left'])))
+    return rows
+
+
+def backfill_battle_turns(apps, schema_editor):
+    """Parse the reports of the existing BattleLogs into BattleTurns, once.
+
+    Compact logs (no report) and logs that already have BattleTurns are
+    skipped, and so are battles of two pokemon with the same name.
+    """
+    BattleLog = apps.get_model('pokemon', 'BattleLog')
+    BattleTurn = apps.get_model('pokemon', 'BattleTurn')
+    Move = apps.get_model('pokemon', 'Move')
+    move_ids = dict(Move.objects.values_list('name', 'id'))
+    done = set(BattleTurn.objects.values_list('battle_log_id', flat=True).distinct())
+    battle_logs = BattleLog.objects.exclude(report='').order_by('id').values_list(
+        'id', 'winner_id', 'loser_id', 'winner__species__name', 'loser__species__name', 'report')
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    fields = ['battle_log', 'number', 'attacker', 'move', 'damage', 'hp_left']
+    columns = ', '.join(quote(BattleTurn._meta.get_field(name).column) for name in fields)
+    sql = (f'INSERT INTO {quote(BattleTurn._meta.db_table)} ({columns}) '
+           f'VALUES ({", ".join(["%s"] * len(fields))})')
+    rows = []
+    with connection.cursor() as cursor:
+        for battle_log_id, winner_id, loser_id, winner_name, loser_name, report in battle_logs.iterator(2000):
+            if battle_log_id in done or winner_name == loser_name:
+                continue
+            turns = parse_report(report, {winner_name: winner_id, loser_name: loser_id}, move_ids)
+            rows.extend((battle_log_id, *turn) for turn in turns or ())
+            if len(rows) >= 10000:
+                cursor.executemany(sql, rows)
+                rows = []
+        if rows:
+            cursor.executemany(sql, rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokemon', '0016_tournament_finished'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_battle_turns, migrations.RunPython.noop),
+    ]
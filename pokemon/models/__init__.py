@@ -4,4 +4,9 @@ from .nature import Nature
 from .ability import Ability
 from .species import Species
 from .pokemon import Pokemon
+from .tournament import Tournament
 from .battle_log import BattleLog
+from .battle_turn import BattleTurn
+from .pokemon_record import PokemonRecord
+from .matchup import Matchup
+from .data_version import DataVersion
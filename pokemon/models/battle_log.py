@@ -1,9 +1,46 @@
+import random
+
 from django.db import models
 
 from .pokemon import Pokemon
+from .tournament import Tournament
 
 
 class BattleLog(models.Model):
     winner = models.ForeignKey(Pokemon, models.CASCADE, related_name='wins')
     loser = models.ForeignKey(Pokemon, models.CASCADE, related_name='losses')
-    report = models.TextField()
+    report = models.TextField(blank=True)
+    tournament = models.ForeignKey(Tournament, models.SET_NULL, null=True, blank=True, related_name='battle_logs')
+
+    # Enough to replay the battle, the report is empty for compact logs.
+    seed = models.BigIntegerField(null=True, blank=True)
+    challenger_won = models.BooleanField(null=True, blank=True)
+    turns = models.IntegerField(null=True, blank=True)     # Both pokemon move in a turn, except in the last one
+    hp_left = models.IntegerField(null=True, blank=True)
+
+    def get_report(self, snapshot=None):
+        """The battle report, regenerated by replaying the battle for compact logs.
+
+        The battle is replayed on a Snapshot (loaded when not given), like the
+        battles of the simulator, so the replay takes the same code path.
+
+        Notes:
+            The replay gives the original report as long as the AI and the
+            pokemon data have not changed since the battle.
+        """
+        if self.report or self.seed is None:
+            return self.report
+        return self.replay(snapshot)
+
+    def replay(self, snapshot=None, log=None):
+        """Replay the battle from its seed on a Snapshot and return the report.
+
+        See Pokemon.use_move() for the log.
+        """
+        if snapshot is None:
+            from pokemon.snapshot import Snapshot  # The snapshot module imports the models.
+            snapshot = Snapshot()
+        winner, loser = snapshot.pokemon[self.winner_id], snapshot.pokemon[self.loser_id]
+        challenger, opponent = (winner, loser) if self.challenger_won else (loser, winner)
+        _winner, report = challenger.battle(opponent, rng=random.Random(self.seed), log=log)
+        return report
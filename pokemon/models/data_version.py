@@ -0,0 +1,24 @@
+from django.db import models
+
+
+class DataVersion(models.Model):
+    """Version number of a kind of data, increased when the data changes (see pokemon.signals).
+
+    Used to tag the entries of Pokemon.cache (see pokemon.pokemon_cache) and
+    the saved transposition tables of the AI (see pokemon.ai).
+    """
+    name = models.CharField(max_length=16, primary_key=True)
+    version = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name} {self.version}'
+
+    @classmethod
+    def current(cls):
+        """{name: version} of all data versions."""
+        return dict(cls.objects.values_list('name', 'version'))
+
+    @classmethod
+    def bump(cls, name):
+        if not cls.objects.filter(name=name).update(version=models.F('version') + 1):
+            cls.objects.get_or_create(name=name, defaults={'version': 1})
@@ -0,0 +1,42 @@
+from django.db import models, transaction
+
+from .pokemon import Pokemon
+
+
+class Matchup(models.Model):
+    """Results of a pokemon that battles (challenges) an opponent."""
+    pokemon = models.ForeignKey(Pokemon, models.CASCADE, related_name='matchups')
+    opponent = models.ForeignKey(Pokemon, models.CASCADE, related_name='+')
+    win_probability = models.FloatField(null=True, blank=True)   # exact, see pokemon.solver
+    battles = models.IntegerField(default=0)    # sampled, see pokemon.montecarlo
+    wins = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('pokemon', 'opponent')]
+
+    def __str__(self):
+        return f'{self.pokemon} vs {self.opponent}'
+
+    @property
+    def win_rate(self):
+        """Fraction of the sampled battles that the pokemon won (None without battles)."""
+        return self.wins / self.battles if self.battles else None
+
+    @classmethod
+    def for_pairs(cls, pairs):
+        """Matchups of (pokemon id, opponent id) pairs, new (unsaved) ones when missing."""
+        existing = {
+            (matchup.pokemon_id, matchup.opponent_id): matchup
+            for matchup in cls.objects.all()
+        }
+        return {
+            pair: existing.get(pair) or cls(pokemon_id=pair[0], opponent_id=pair[1])
+            for pair in pairs
+        }
+
+    @classmethod
+    def save_all(cls, matchups, fields):
+        """Save the fields of many (new or existing) matchups with bulk queries."""
+        with transaction.atomic():
+            cls.objects.bulk_update([matchup for matchup in matchups if matchup.pk], fields)
+            cls.objects.bulk_create([matchup for matchup in matchups if not matchup.pk])
@@ -3,39 +3,25 @@ import random
 
 from django.db import models
 
-from .type import Type
+from .type import Type, type_chart
 
 
-class Move(models.Model):
-    name = models.CharField(max_length=16)
-    power = models.IntegerField()
-    priority = models.IntegerField()
-    pp = models.IntegerField()
-    accuracy = models.IntegerField()
-    type = models.ForeignKey(Type, models.PROTECT)
-    drain = models.IntegerField()
-    recoil = models.IntegerField()
-    nerf_factor = models.FloatField(default=1.0)
-    is_noteworthy = models.BooleanField(default=False)
-
-    class DamageClass(models.TextChoices):
-        PHYSICAL = 'PH', 'Physical'
-        SPECIAL = 'SP', 'Special'
-        STATUS = 'ST', 'Status'
-
-    damage_class = models.CharField(max_length=2, choices=DamageClass.choices)
+class MoveMixin:
+    """Damage calculations, shared by Move and the in-memory MoveSnapshot."""
+    __slots__ = ()
 
     def __str__(self):
         return self.name
 
     def _stab(self, attacker, damage):
         """Apply same type attack bonus (STAB) to the damage."""
-        types = [attacker.species.type1, attacker.species.type2]
-        return (3 * damage) // 2 if (self.type in types) else damage
+        types = [attacker.species.type1_id, attacker.species.type2_id]
+        return (3 * damage) // 2 if (self.type_id in types) else damage
 
     def _effectiveness(self, defender, damage):
         """Apply type effectiveness to the damage."""
-        effectiveness = defender.species.effectiveness(self.type)
+        species = defender.species
+        effectiveness = type_chart().multiplier(self.type_id, species.type1_id, species.type2_id)
         return math.floor(effectiveness * damage)
 
     def _apply_type(self, attacker, defender, damage):
@@ -82,10 +68,33 @@ class Move(models.Model):
         """HP healed by draining HP of the defender."""
         return damage * self.drain // 100
 
-    def damage(self, attacker, defender):
-        """Actual damage when used by an attacker against a defender."""
-        if random.random() * 100 < self.accuracy:
-            random_number = random.randrange(85, 101)
+    def damage(self, attacker, defender, rng=random):
+        """Actual damage when used by an attacker against a defender.
+
+        The random numbers are drawn from rng, e.g. a seeded random.Random.
+        """
+        if rng.random() * 100 < self.accuracy:
+            random_number = rng.randrange(85, 101)
             return self.true_damage(attacker, defender, random_number)
         else:
             return 0
+
+
+class Move(MoveMixin, models.Model):
+    name = models.CharField(max_length=16)
+    power = models.IntegerField()
+    priority = models.IntegerField()
+    pp = models.IntegerField()
+    accuracy = models.IntegerField()
+    type = models.ForeignKey(Type, models.PROTECT)
+    drain = models.IntegerField()
+    recoil = models.IntegerField()
+    nerf_factor = models.FloatField(default=1.0)
+    is_noteworthy = models.BooleanField(default=False)
+
+    class DamageClass(models.TextChoices):
+        PHYSICAL = 'PH', 'Physical'
+        SPECIAL = 'SP', 'Special'
+        STATUS = 'ST', 'Status'
+
+    damage_class = models.CharField(max_length=2, choices=DamageClass.choices)
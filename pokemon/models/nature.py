@@ -1,7 +1,19 @@
 from django.db import models
 
 
-class Nature(models.Model):
+class NatureMixin:
+    """Shared by Nature and the in-memory NatureSnapshot."""
+    __slots__ = ()
+
+    def __str__(self):
+        return self.name
+
+    def modifier(self, stat):
+        modifiers = {self.increased_stat: 1.1, self.decreased_stat: 0.9}
+        return modifiers.get(stat, 1)
+
+
+class Nature(NatureMixin, models.Model):
     name = models.CharField(max_length=16)
     CHOICES = (
         ('attack', 'attack'),
@@ -12,10 +24,3 @@ class Nature(models.Model):
     )
     increased_stat = models.CharField(max_length=16, choices=CHOICES, blank=True)
     decreased_stat = models.CharField(max_length=16, choices=CHOICES, blank=True)
-
-    def __str__(self):
-        return self.name
-
-    def modifier(self, stat):
-        modifiers = {self.increased_stat: 1.1, self.decreased_stat: 0.9}
-        return modifiers.get(stat, 1)
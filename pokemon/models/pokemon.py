@@ -1,5 +1,6 @@
 from math import floor
 import random
+from typing import NamedTuple
 
 from django.db import models
 
@@ -7,35 +8,37 @@ from .nature import Nature
 from .ability import Ability
 from .species import Species
 from .move import Move
-from pokemon.ai import select_move
+from pokemon import ai
 
 
-class Pokemon(models.Model):
-    species = models.ForeignKey(Species, models.PROTECT)
-    level = models.IntegerField(default=50)
-    nature = models.ForeignKey(Nature, models.PROTECT)
-    ability = models.ForeignKey(Ability, models.PROTECT)
-    moves = models.ManyToManyField(Move)
-    cache = models.JSONField(default=dict, blank=True)
+STATS = ('hp', 'attack', 'special_attack', 'defense', 'special_defense', 'speed')
 
-    # IV's
-    iv_hp = models.IntegerField(default=15)
-    iv_attack = models.IntegerField(default=15)
-    iv_special_attack = models.IntegerField(default=15)
-    iv_defense = models.IntegerField(default=15)
-    iv_special_defense = models.IntegerField(default=15)
-    iv_speed = models.IntegerField(default=15)
 
-    # EV's
-    ev_hp = models.IntegerField(default=20)
-    ev_attack = models.IntegerField(default=20)
-    ev_special_attack = models.IntegerField(default=20)
-    ev_defense = models.IntegerField(default=20)
-    ev_special_defense = models.IntegerField(default=20)
-    ev_speed = models.IntegerField(default=20)
+class StatBlock(NamedTuple):
+    hp: int
+    attack: int
+    special_attack: int
+    defense: int
+    special_defense: int
+    speed: int
 
-    class Meta:
-        verbose_name_plural = 'pokemon'
+
+class PokemonMixin:
+    """Stats and battle logic, shared by Pokemon and the in-memory PokemonSnapshot."""
+    __slots__ = ()
+
+    # Attributes that the stats depend on, setting one of them invalidates the StatBlock.
+    # Note that changes of the Species or Nature instances themselves are not detected.
+    # The AI caches are only cleared when a pokemon is saved, see pokemon.signals.
+    STAT_ATTRIBUTES = frozenset(
+        ['species', 'species_id', 'nature', 'nature_id', 'level'] +
+        [f'{prefix}_{stat}' for prefix in ('iv', 'ev') for stat in STATS]
+    )
+
+    def __setattr__(self, name, value):
+        if name in PokemonMixin.STAT_ATTRIBUTES:
+            super().__setattr__('_stats', None)
+        super().__setattr__(name, value)
 
     def __str__(self):
         return self.species.name
@@ -47,29 +50,43 @@ class Pokemon(models.Model):
         stat = (((2*base_stat + iv + ev//4) * self.level) // 100) + 5
         return floor(stat * self.nature.modifier(stat_name))
 
+    def _compute_stats(self):
+        stats = {stat_name: self._stat(stat_name) for stat_name in STATS}
+        stats['hp'] += 5 + self.level
+        return StatBlock(**stats)
+
+    @property
+    def stats(self):
+        """The StatBlock, computed once until an attribute it depends on changes."""
+        stats = getattr(self, '_stats', None)
+        if stats is None:
+            stats = self._compute_stats()
+            super().__setattr__('_stats', stats)
+        return stats
+
     @property
     def hp(self):
-        return self._stat('hp') + 5 + self.level
+        return self.stats.hp
 
     @property
     def attack(self):
-        return self._stat('attack')
+        return self.stats.attack
 
     @property
     def special_attack(self):
-        return self._stat('special_attack')
+        return self.stats.special_attack
 
     @property
     def defense(self):
-        return self._stat('defense')
+        return self.stats.defense
 
     @property
     def special_defense(self):
-        return self._stat('special_defense')
+        return self.stats.special_defense
 
     @property
     def speed(self):
-        return self._stat('speed')
+        return self.stats.speed
 
     def first(self, move, opponent, opponent_move):
         """Returns the Pokemon that moves first or None if it is random."""
@@ -85,13 +102,19 @@ class Pokemon(models.Model):
             else:
                 return None
 
-    def use_move(self, move, opponent):
-        """Use a move against another Pokemon."""
-        damage = move.damage(self, opponent)
+    def use_move(self, move, opponent, rng=random, log=None):
+        """Use a move against another Pokemon.
+
+        When a log (list) is given, (attacker, move, damage, opponent HP left)
+        is appended to it.
+        """
+        damage = move.damage(self, opponent, rng)
         damage_dealt = min(opponent.current_hp, damage)
         opponent.current_hp -= damage_dealt
         self.current_hp -= min(move.recoil_damage(damage_dealt), self.current_hp)
         self.current_hp += min(move.drain_recovery(damage_dealt), self.hp - self.current_hp)
+        if log is not None:
+            log.append((self, move, damage, opponent.current_hp))
         return (f'{self} uses {move} with {damage} {move.damage_class} damage.\n'
             f'HP left: {self} ({self.current_hp}) and {opponent} ({opponent.current_hp}).\n')
 
@@ -100,24 +123,63 @@ class Pokemon(models.Model):
         battle_report += f'{winner} wins with {hp_left:.2f}% HP left.\n'
         return winner, battle_report
 
-    def battle(self, opponent):
-        """Battle with another Pokemon. The winner is returned."""
+    def battle(self, opponent, rng=random, log=None):
+        """Battle with another Pokemon. The winner is returned.
+
+        All random numbers are drawn from rng, so a battle with a seeded
+        random.Random can be replayed. See use_move() for the log.
+        """
         battle_report = f'{self} vs {opponent}\n'
         for pokemon in [self, opponent]:
             pokemon.current_hp = pokemon.hp     # Initialize with full HP
         while True:
             # Select moves:
-            move = select_move(self, opponent)
-            opponent_move = select_move(opponent, self)
+            move, opponent_move = ai.select_moves(self, opponent)
             # Determine move order:
             first = self.first(move, opponent, opponent_move)
-            first = first if (first is not None) else random.choice((self, opponent))
+            first = first if (first is not None) else rng.choice((self, opponent))
             move_order = ((self, move, opponent), (opponent, opponent_move, self))
             move_order = move_order if (first is self) else reversed(move_order)
             # Execute the moves:
             for attacker, move, defender in move_order:
-                battle_report += attacker.use_move(move, defender)
+                battle_report += attacker.use_move(move, defender, rng, log)
                 if defender.current_hp == 0:
                     return self._finish_battle(attacker, defender, battle_report)
                 elif attacker.current_hp == 0:
                     return self._finish_battle(defender, attacker, battle_report)
+
+
+class Pokemon(PokemonMixin, models.Model):
+    species = models.ForeignKey(Species, models.PROTECT)
+    level = models.IntegerField(default=50)
+    nature = models.ForeignKey(Nature, models.PROTECT)
+    ability = models.ForeignKey(Ability, models.PROTECT)
+    moves = models.ManyToManyField(Move)
+    cache = models.JSONField(default=dict, blank=True)
+
+    # IV's
+    iv_hp = models.IntegerField(default=15)
+    iv_attack = models.IntegerField(default=15)
+    iv_special_attack = models.IntegerField(default=15)
+    iv_defense = models.IntegerField(default=15)
+    iv_special_defense = models.IntegerField(default=15)
+    iv_speed = models.IntegerField(default=15)
+
+    # EV's
+    ev_hp = models.IntegerField(default=20)
+    ev_attack = models.IntegerField(default=20)
+    ev_special_attack = models.IntegerField(default=20)
+    ev_defense = models.IntegerField(default=20)
+    ev_special_defense = models.IntegerField(default=20)
+    ev_speed = models.IntegerField(default=20)
+
+    class Meta:
+        verbose_name_plural = 'pokemon'
+
+    def usable_moves(self):
+        """Moves that do damage, the other moves are ignored by the AI.
+
+        Ordered by id, like in the snapshot: ties between moves are broken by
+        the first move, so both need the same order.
+        """
+        return self.moves.filter(power__gt=0, nerf_factor__gt=0.0).order_by('id')
@@ -0,0 +1,55 @@
+from django.db import models, transaction
+
+from .pokemon import Pokemon
+from .tournament import Tournament
+
+
+class PokemonRecord(models.Model):
+    """Results of a pokemon in a tournament, updated when its BattleLogs are stored."""
+    tournament = models.ForeignKey(Tournament, models.CASCADE, related_name='records')
+    pokemon = models.ForeignKey(Pokemon, models.CASCADE, related_name='records')
+    wins = models.IntegerField(default=0)
+    losses = models.IntegerField(default=0)
+    hp_left = models.IntegerField(default=0)    # total HP left after the wins
+    win_percentage = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = [('tournament', 'pokemon')]
+        indexes = [models.Index(fields=['tournament', '-win_percentage'])]
+
+    def __str__(self):
+        return f'{self.pokemon} in {self.tournament}'
+
+    @property
+    def battles(self):
+        return self.wins + self.losses
+
+    @property
+    def mean_hp_left(self):
+        """Mean HP left after a win (None without wins)."""
+        return self.hp_left / self.wins if self.wins else None
+
+    def _update_win_percentage(self):
+        self.win_percentage = round(self.wins / self.battles * 100, 2) if self.battles else 0.0
+
+    @classmethod
+    def add_battle_logs(cls, tournament, battle_logs):
+        """Add the results of new BattleLogs to the records, with bulk queries."""
+        records = {
+            record.pokemon_id: record
+            for record in cls.objects.filter(tournament=tournament)
+        }
+        for battle_log in battle_logs:
+            for pokemon_id in (battle_log.winner_id, battle_log.loser_id):
+                if pokemon_id not in records:
+                    records[pokemon_id] = cls(tournament=tournament, pokemon_id=pokemon_id)
+            winner = records[battle_log.winner_id]
+            winner.wins += 1
+            winner.hp_left += battle_log.hp_left or 0
+            records[battle_log.loser_id].losses += 1
+        for record in records.values():
+            record._update_win_percentage()
+        fields = ['wins', 'losses', 'hp_left', 'win_percentage']
+        with transaction.atomic():
+            cls.objects.bulk_update([record for record in records.values() if record.pk], fields)
+            cls.objects.bulk_create([record for record in records.values() if not record.pk])
@@ -1,9 +1,21 @@
 from django.db import models
 
-from .type import Type
+from .type import Type, type_chart
 
 
-class Species(models.Model):
+class SpeciesMixin:
+    """Shared by Species and the in-memory SpeciesSnapshot."""
+    __slots__ = ()
+
+    def __str__(self):
+        return self.name
+
+    def effectiveness(self, type):
+        """Effectiveness of a Type against this PokemonSpecies."""
+        return type_chart().multiplier(type.id, self.type1_id, self.type2_id)
+
+
+class Species(SpeciesMixin, models.Model):
     id = models.IntegerField(primary_key=True)
     name = models.CharField(max_length=16)
     type1 = models.ForeignKey(Type, models.PROTECT, related_name='species1')
@@ -20,13 +32,3 @@ class Species(models.Model):
 
     class Meta:
         verbose_name_plural = 'species'
-
-    def __str__(self):
-        return self.name
-
-    def effectiveness(self, type):
-        """Effectiveness of a Type against this PokemonSpecies."""
-        effectiveness = type.effectiveness(self.type1)
-        if self.type2:
-            effectiveness *= type.effectiveness(self.type2)
-        return effectiveness
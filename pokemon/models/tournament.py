@@ -0,0 +1,28 @@
+from django.db import models
+
+
+class Tournament(models.Model):
+    """A run of the simulator, its BattleLogs and PokemonRecords belong to it."""
+
+    class Kind(models.TextChoices):
+        ROUND_ROBIN = 'RR', 'round-robin'
+        SWISS = 'SW', 'swiss'
+
+    kind = models.CharField(max_length=2, choices=Kind.choices, default=Kind.ROUND_ROBIN)
+    seed = models.BigIntegerField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)  # Set when all battles are stored
+
+    def __str__(self):
+        status = '' if self.finished else ', unfinished'
+        return f'{self.get_kind_display()} {self.id} ({self.created:%Y-%m-%d %H:%M}{status})'
+
+    @classmethod
+    def latest(cls, kind=None, finished=False):
+        """The latest tournament (of a kind), or the latest finished one, None if there is none."""
+        tournaments = cls.objects.all()
+        if kind is not None:
+            tournaments = tournaments.filter(kind=kind)
+        if finished:
+            tournaments = tournaments.filter(finished__isnull=False)
+        return tournaments.order_by('-id').first()
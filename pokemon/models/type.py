@@ -1,26 +1,72 @@
+from functools import lru_cache
+
 from django.db import models
-from django.utils.functional import cached_property
 
 
-class Type(models.Model):
-    name = models.CharField(max_length=16)
-    weaknesses = models.ManyToManyField('self', symmetrical=False, related_name='strong_against', blank=True)
-    resistances = models.ManyToManyField('self', symmetrical=False, related_name='weak_against', blank=True)
-    immunities = models.ManyToManyField('self', symmetrical=False, related_name='no_effect_against', blank=True)
+class TypeChart:
+    """Effectiveness of every attacking type against every defending type.
+
+    The types are indexed by integers, matrix[attacking][defending] is the
+    effectiveness. The multipliers against dual-type defenders are computed
+    up front for every combination of two types.
+    """
+
+    def __init__(self, type_ids, factors):
+        self.index = {type_id: i for i, type_id in enumerate(type_ids)}
+        self.matrix = [[1.0] * len(type_ids) for _type_id in type_ids]
+        for (attacking_id, defending_id), factor in factors.items():
+            self.matrix[self.index[attacking_id]][self.index[defending_id]] = factor
+        self._multipliers = {}
+        for type1_id in type_ids:
+            for type2_id in list(type_ids) + [None]:
+                for attacking_id in type_ids:
+                    effectiveness = self.effectiveness(attacking_id, type1_id)
+                    if type2_id is not None:
+                        effectiveness *= self.effectiveness(attacking_id, type2_id)
+                    self._multipliers[(attacking_id, type1_id, type2_id)] = effectiveness
+
+    @classmethod
+    def load(cls):
+        """Load the chart from the database (four queries)."""
+        type_ids = list(Type.objects.order_by('pk').values_list('pk', flat=True))
+        factors = {}
+        relations = {'weaknesses': 2.0, 'resistances': 0.5, 'immunities': 0.0}
+        for attribute, factor in relations.items():
+            through = getattr(Type, attribute).through
+            # A row (from_type, to_type) means that to_type attacks from_type with the factor.
+            for defending_id, attacking_id in through.objects.values_list('from_type_id', 'to_type_id'):
+                factors[(attacking_id, defending_id)] = factor
+        return cls(type_ids, factors)
+
+    def effectiveness(self, attacking_id, defending_id):
+        """Effectiveness of an attacking type against a defending type."""
+        return self.matrix[self.index[attacking_id]][self.index[defending_id]]
+
+    def multiplier(self, attacking_id, type1_id, type2_id):
+        """Effectiveness of an attacking type against a (dual-type) defender."""
+        return self._multipliers[(attacking_id, type1_id, type2_id)]
+
+
+@lru_cache(maxsize=None)
+def type_chart():
+    """Process-wide TypeChart, cleared by signals when types are edited."""
+    return TypeChart.load()
+
+
+class TypeMixin:
+    """Shared by Type and the in-memory TypeSnapshot."""
+    __slots__ = ()
 
     def __str__(self):
         return self.name
 
-    @cached_property
-    def _effectiveness_dict(self):
-        """Cache to avoid many database queries."""
-        factors = {'strong_against': 2.0, 'weak_against': 0.5, 'no_effect_against': 0.0}
-        return {
-            type: factor
-            for attribute, factor in factors.items()
-            for type in getattr(self, attribute).all()
-        }
-
     def effectiveness(self, other):
         """Effectiveness when attacking another Type."""
-        return self._effectiveness_dict.get(other, 1.0)
+        return type_chart().effectiveness(self.id, other.id)
+
+
+class Type(TypeMixin, models.Model):
+    name = models.CharField(max_length=16)
+    weaknesses = models.ManyToManyField('self', symmetrical=False, related_name='strong_against', blank=True)
+    resistances = models.ManyToManyField('self', symmetrical=False, related_name='weak_against', blank=True)
+    immunities = models.ManyToManyField('self', symmetrical=False, related_name='no_effect_against', blank=True)
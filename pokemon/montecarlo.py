@@ -0,0 +1,75 @@
+import math
+import random
+
+from pokemon import simulator
+from pokemon.models import Matchup
+from pokemon.snapshot import Snapshot
+
+Z = 1.96    # 95% confidence intervals.
+
+
+def wilson_interval(wins, battles, z=Z):
+    """Wilson score interval of a win rate, (0, 1) without battles."""
+    if battles == 0:
+        return 0.0, 1.0
+    p = wins / battles
+    denominator = 1 + z**2 / battles
+    center = (p + z**2 / (2 * battles)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / battles + z**2 / (4 * battles**2)) / denominator
+    return center - half_width, center + half_width
+
+
+def is_resolved(wins, battles, precision, z=Z):
+    """Whether the win rate is known within +- precision."""
+    low, high = wilson_interval(wins, battles, z)
+    return (high - low) / 2 <= precision
+
+
+def sample_matchup(pokemon, opponent, precision=0.05, max_battles=1000, seed=None, wins=0, battles=0):
+    """Repeat a battle until the win rate of the pokemon is known within precision.
+
+    Sequential test: after every battle, the Wilson interval (95%) is checked,
+    so lopsided matchups stop after a few dozen battles and close matchups
+    continue up to max_battles. Sampling can continue from earlier counts
+    (wins, battles). Every battle has its own seed, derived from the run seed,
+    the pair and the number of the battle. Returns the new (wins, battles).
+    """
+    while battles < max_battles and not is_resolved(wins, battles, precision):
+        battle_seed = simulator._battle_seed(
+            f'{seed}:{battles}' if seed is not None else None, pokemon, opponent)
+        winner, _report = pokemon.battle(opponent, rng=random.Random(battle_seed))
+        wins += (winner is pokemon)
+        battles += 1
+    return wins, battles
+
+
+def sample_matchups(precision=0.05, max_battles=1000, seed=None, save_every=1000):
+    """Sample the win rates of all ordered pairs and store the counts in the Matchups.
+
+    Existing counts are continued (not replaced), so a run with a smaller
+    precision only adds the missing battles. The counts are saved every
+    save_every pairs, so an interrupted run loses at most one batch and the
+    next run continues from the saved counts. Returns the number of battles.
+    """
+    snapshot = Snapshot()
+    pokemons = list(snapshot.pokemon.values())
+    matchups = Matchup.for_pairs(
+        (pokemon.id, opponent.id)
+        for pokemon in pokemons
+        for opponent in pokemons
+        if pokemon is not opponent
+    )
+    battles = 0
+    batch = []
+    for (pokemon_id, opponent_id), matchup in matchups.items():
+        previous = matchup.battles
+        matchup.wins, matchup.battles = sample_matchup(
+            snapshot.pokemon[pokemon_id], snapshot.pokemon[opponent_id], precision, max_battles,
+            seed, matchup.wins, matchup.battles)
+        battles += matchup.battles - previous
+        batch.append(matchup)
+        if len(batch) >= save_every:
+            Matchup.save_all(batch, ['wins', 'battles'])
+            batch = []
+    Matchup.save_all(batch, ['wins', 'battles'])
+    return battles
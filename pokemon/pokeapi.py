@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from django.conf import settings
+
+# Resources with an id from 10001 up are alternate forms, shadow moves etc.
+ALTERNATE_ID = 10001
+
+
+def resource_id(url):
+    """Id of a resource from its url, e.g. .../pokemon-species/1/ -> 1."""
+    return int(url.rstrip('/').rsplit('/', 1)[1])
+
+
+class PokeAPI:
+    """Client of the Pokemon API with a persistent response cache.
+
+    Every response is stored as a JSON file, keyed by endpoint and id (or
+    name), in cache_dir. Later requests for the same resource, also in other
+    runs, are served from disk. Resources are fetched concurrently by at most
+    max_workers threads. Responses are returned as SimpleNamespaces, so the
+    attributes can be accessed like with pokebase (move.type.name).
+    """
+
+    def __init__(self, base_url=None, cache_dir=None, max_workers=None, retries=5, backoff=1.0):
+        self.base_url = (base_url or getattr(settings, 'POKEAPI_URL', 'https://pokeapi.co/api/v2/')).rstrip('/')
+        self.cache_dir = cache_dir or getattr(settings, 'POKEAPI_CACHE_DIR', 'pokeapi_cache')
+        self.max_workers = max_workers or getattr(settings, 'POKEAPI_MAX_WORKERS', 8)
+        self.retries = retries
+        self.backoff = backoff  # Seconds before the first retry, doubled for every next one.
+        self.requests = 0   # Number of responses that were not in the cache.
+        self._lock = threading.Lock()
+
+    def _path(self, endpoint, key):
+        return os.path.join(self.cache_dir, endpoint, f'{key}.json')
+
+    def _download(self, url):
+        """Text of a response, retried with exponential backoff.
+
+        Rate limiting (429), server errors and network errors (timeouts, reset
+        connections) are retried, a Retry-After header is respected.
+        """
+        request = urllib.request.Request(url, headers={'User-Agent': 'djangomon'})
+        for attempt in range(self.retries):
+            delay = self.backoff * 2 ** attempt
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    return response.read().decode()
+            except urllib.error.HTTPError as error:
+                if (error.code != 429 and error.code < 500) or attempt == self.retries - 1:
+                    raise
+                retry_after = error.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+            except OSError:     # Also URLError, TimeoutError and ConnectionResetError.
+                if attempt == self.retries - 1:
+                    raise
+            time.sleep(delay)
+
+    def _get_text(self, endpoint, key, query=''):
+        path = self._path(endpoint, key)
+        try:
+            with open(path) as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        text = self._download(f'{self.base_url}/{endpoint}/{"" if key == "list" else key}{query}')
+        with self._lock:
+            self.requests += 1
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}'
+        with open(temporary, 'w') as f:
+            f.write(text)
+        os.replace(temporary, path)     # Atomic, so concurrent runs never see half a file.
+        return text
+
+    def get(self, endpoint, key):
+        """One resource, e.g. get('move', 1) or get('pokemon', 'bulbasaur')."""
+        return json.loads(self._get_text(endpoint, key), object_hook=lambda d: SimpleNamespace(**d))
+
+    def get_many(self, endpoint, keys):
+        """Resources of one endpoint, fetched concurrently, in the order of the keys."""
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            return list(executor.map(lambda key: self.get(endpoint, key), keys))
+
+    def ids(self, endpoint, max_id=None):
+        """Sorted ids of all resources of an endpoint, without the alternate ones."""
+        results = json.loads(self._get_text(endpoint, 'list', '?limit=100000'))['results']
+        ids = sorted(resource_id(result['url']) for result in results)
+        return [i for i in ids if i < ALTERNATE_ID and (max_id is None or i <= max_id)]
+
+    def get_all(self, endpoint, max_id=None):
+        """All resources of an endpoint (up to max_id), fetched concurrently."""
+        return self.get_many(endpoint, self.ids(endpoint, max_id))
@@ -0,0 +1,71 @@
+from pokemon.models import DataVersion, Pokemon, Species
+
+
+def _noteworthy(pokemons):
+    """Noteworthy moves of the pokemon, {pokemon id: 'move, move'} (one query)."""
+    pokemon_moves = Pokemon.moves.through.objects.filter(
+        pokemon__in=[pokemon.id for pokemon in pokemons], move__is_noteworthy=True
+    ).order_by('pk').values_list('pokemon_id', 'move__name')
+    moves = {}
+    for pokemon_id, move_name in pokemon_moves:
+        moves.setdefault(pokemon_id, []).append(move_name)
+    return {pokemon.id: ', '.join(moves.get(pokemon.id, [])) for pokemon in pokemons}
+
+
+def _evolutions(pokemons):
+    """Species that the pokemon evolve into, {pokemon id: 'species, species'} (one query)."""
+    species = Species.objects.filter(
+        evolves_from__in={pokemon.species_id for pokemon in pokemons}
+    ).order_by('pk').values_list('evolves_from_id', 'name')
+    evolutions = {}
+    for evolves_from_id, name in species:
+        evolutions.setdefault(evolves_from_id, []).append(name)
+    return {pokemon.id: ', '.join(evolutions.get(pokemon.species_id, [])) for pokemon in pokemons}
+
+
+# Cached attribute -> (function that computes it for many pokemon, data it depends on).
+# The data versions are increased by pokemon.signals.
+CACHED = {
+    'noteworthy': (_noteworthy, 'moves'),
+    'evolutions': (_evolutions, 'species'),
+}
+
+
+def _is_fresh(pokemon, attribute, versions):
+    entry = pokemon.cache.get(attribute)
+    _compute, dependency = CACHED[attribute]
+    return isinstance(entry, dict) and entry.get('version') == versions.get(dependency, 0)
+
+
+def refresh(pokemons, versions=None):
+    """Recompute the stale cache entries of the pokemon, with bulk queries.
+
+    Every entry is tagged with the version of the data it depends on, so an
+    entry is stale when that data changed after it was computed. Returns the
+    number of pokemon that were updated.
+    """
+    pokemons = list(pokemons)
+    versions = DataVersion.current() if versions is None else versions
+    updated = {}
+    for attribute, (compute, dependency) in CACHED.items():
+        stale = [pokemon for pokemon in pokemons if not _is_fresh(pokemon, attribute, versions)]
+        if stale:
+            values = compute(stale)
+            for pokemon in stale:
+                pokemon.cache[attribute] = {'version': versions.get(dependency, 0), 'value': values[pokemon.id]}
+                updated[pokemon.id] = pokemon
+    Pokemon.objects.bulk_update(updated.values(), ['cache'], batch_size=500)
+    return len(updated)
+
+
+def get(pokemon, attribute, versions=None):
+    """A cached attribute of a pokemon, computed when missing or stale."""
+    versions = DataVersion.current() if versions is None else versions
+    if not _is_fresh(pokemon, attribute, versions):
+        refresh([pokemon], versions)
+    return pokemon.cache[attribute]['value']
+
+
+def recompute():
+    """Refresh the cache of all pokemon, returns the number of updated pokemon."""
+    return refresh(Pokemon.objects.only('id', 'species_id', 'cache'))
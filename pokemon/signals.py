@@ -0,0 +1,79 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from pokemon import ai
+from pokemon.models import DataVersion, Move, Nature, Pokemon, Species, Type
+from pokemon.models.type import type_chart
+
+
+@receiver(post_save, sender=Move)
+@receiver(post_save, sender=Nature)
+@receiver(post_save, sender=Pokemon)
+@receiver(post_save, sender=Species)
+@receiver(post_save, sender=Type)
+@receiver(post_delete, sender=Move)
+@receiver(post_delete, sender=Pokemon)
+def clear_ai_caches(sender, update_fields=None, **kwargs):
+    """The AI caches are keyed on ids, so clear them when the data changes."""
+    if update_fields and set(update_fields) == {'cache'}:
+        return  # Only the admin cache changed.
+    ai.clear_caches()
+
+
+@receiver(post_save, sender=Type)
+@receiver(post_delete, sender=Type)
+def clear_type_chart(sender, **kwargs):
+    type_chart.cache_clear()
+
+
+@receiver(m2m_changed, sender=Type.weaknesses.through)
+@receiver(m2m_changed, sender=Type.resistances.through)
+@receiver(m2m_changed, sender=Type.immunities.through)
+def clear_type_chart_on_relation_change(sender, action, **kwargs):
+    """Also called when the relations are edited in the admin."""
+    if action.startswith('post_'):
+        type_chart.cache_clear()
+        ai.clear_caches()
+        DataVersion.bump('types')
+
+
+@receiver(m2m_changed, sender=Pokemon.moves.through)
+def clear_move_index(sender, instance, action, reverse, **kwargs):
+    """Rebuild the move index of a pokemon when its moves change.
+
+    Only the index of the instance itself is reset (when the moves are changed
+    from the Move side, the pokemon instances are not available).
+    """
+    if action.startswith('post_'):
+        if not reverse:
+            instance._move_index = None
+        ai.clear_caches()
+        DataVersion.bump('moves')
+
+
+@receiver(post_save, sender=Move)
+@receiver(post_delete, sender=Move)
+def bump_moves_version(sender, **kwargs):
+    DataVersion.bump('moves')
+
+
+@receiver(post_save, sender=Species)
+@receiver(post_delete, sender=Species)
+def bump_species_version(sender, **kwargs):
+    DataVersion.bump('species')
+
+
+@receiver(post_save, sender=Pokemon)
+@receiver(post_save, sender=Nature)
+@receiver(post_delete, sender=Pokemon)
+@receiver(post_delete, sender=Nature)
+def bump_pokemon_version(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {'cache'}:
+        return  # Only the admin cache changed.
+    DataVersion.bump('pokemon')
+
+
+@receiver(post_save, sender=Type)
+@receiver(post_delete, sender=Type)
+def bump_types_version(sender, **kwargs):
+    DataVersion.bump('types')
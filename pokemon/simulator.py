@@ -1,23 +1,277 @@
-from pokemon.models import BattleLog
-from pokemon.models import Pokemon
+import hashlib
+import multiprocessing
+import random
+import time
 
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils import timezone
 
-def battle(resume_pokemon1=None, resume_pokemon2=None):
-    """Run the Pokemon battle simulator."""
+from pokemon import ai
+from pokemon.damage_table import DamageTable
+from pokemon.instrumentation import Instrumentation, report as instrumentation_report
+from pokemon.models import BattleLog, BattleTurn, DataVersion, Pokemon, PokemonRecord, Tournament
+from pokemon.snapshot import Snapshot
+
+SHARD_SIZE = 100    # Number of battles that a worker process runs per task.
+
+# Pokemon of the running tournament, also used by the worker processes (fork).
+_snapshot = None
+
+
+def _pairs(pokemons, resume_pokemon1=None, resume_pokemon2=None):
+    """Ids of all ordered pairs of different pokemon, optionally from a resume pair."""
     skip = resume_pokemon1 and resume_pokemon2
-    pokemons = Pokemon.objects.order_by('id')
     for pokemon1 in pokemons:
         for pokemon2 in pokemons:
             if skip:
-                if (pokemon1 == resume_pokemon1) and (pokemon2 == resume_pokemon2):
+                if (pokemon1.id == resume_pokemon1.id) and (pokemon2.id == resume_pokemon2.id):
                     skip = False
                 else:
                     continue
-            if pokemon1 != pokemon2:
-                winner, report = pokemon1.battle(pokemon2)
-                loser = pokemon1 if winner is pokemon2 else pokemon2
-                BattleLog.objects.create(winner=winner, loser=loser, report=report)
-                print(report)
+            if pokemon1 is not pokemon2:
+                yield pokemon1.id, pokemon2.id
+
+
+def _shards(pairs, seed, compact):
+    shard = []
+    for pair in pairs:
+        shard.append(pair)
+        if len(shard) == SHARD_SIZE:
+            yield seed, compact, shard
+            shard = []
+    if shard:
+        yield seed, compact, shard
+
+
+def _battle_seed(seed, pokemon1, pokemon2):
+    """Seed of a single battle (positive 63 bit), derived from the run seed and the pair."""
+    if seed is None:
+        return random.getrandbits(63)
+    digest = hashlib.sha256(f'{seed}:{pokemon1.id}:{pokemon2.id}'.encode()).digest()
+    return int.from_bytes(digest[:8], 'big') >> 1
+
+
+def _battle(pokemon1, pokemon2, seed, compact):
+    """Battle between two pokemon with its own seeded random generator.
+
+    Returns an unsaved BattleLog. A compact BattleLog has no report and no
+    events, because both can be regenerated from the seed (see
+    replay_battle_turns). Otherwise the moves are kept in battle_log.events as
+    (attacker id, move id, damage, HP left) tuples, which BattleLogWriter
+    stores as BattleTurns.
+    """
+    battle_seed = _battle_seed(seed, pokemon1, pokemon2)
+    log = []
+    winner, report = pokemon1.battle(pokemon2, rng=random.Random(battle_seed), log=log)
+    loser = pokemon1 if winner is pokemon2 else pokemon2
+    battle_log = BattleLog(
+        winner_id=winner.id,
+        loser_id=loser.id,
+        report='' if compact else report,
+        seed=battle_seed,
+        challenger_won=(winner is pokemon1),
+        turns=(len(log) + 1) // 2,   # Only the last turn can have a single move.
+        hp_left=winner.current_hp,
+    )
+    if not compact:
+        battle_log.events = _events(log)
+    return battle_log
+
+
+def _events(log):
+    return [(attacker.id, move.id, damage, hp_left) for attacker, move, damage, hp_left in log]
+
+
+def _battle_shard(shard):
+    seed, compact, pairs = shard
+    return [
+        _battle(_snapshot.pokemon[id1], _snapshot.pokemon[id2], seed, compact)
+        for id1, id2 in pairs
+    ]
+
+
+def _init_worker():
+    random.seed()   # Forked workers would otherwise share the random state.
+
+
+class BattleLogWriter:
+    """Buffers BattleLogs and stores them with one bulk_create per transaction.
+
+    The buffer is flushed every flush_battles battles or flush_seconds seconds
+    (checked when a battle is added), whichever comes first, and on exit. In
+    quiet mode the battle reports are not printed. With a tournament, the
+    BattleLogs belong to it and its PokemonRecords are updated in the same
+    transaction, and it is marked as finished on exit (unless an exception
+    stopped the battles).
+
+    The events of the BattleLogs (see _battle) are stored as BattleTurns. The
+    writer assigns the ids of the BattleLogs itself, because bulk_create does
+    not return them on every database, so there must be only one writer at a
+    time.
+    """
+
+    def __init__(self, flush_battles=1000, flush_seconds=10.0, quiet=False, tournament=None):
+        self.flush_battles = flush_battles
+        self.flush_seconds = flush_seconds
+        self.quiet = quiet
+        self.tournament = tournament
+        self.battles = 0
+        self._buffer = []
+        self._next_id = None
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+        if exc_type is None and self.tournament is not None:
+            self.tournament.finished = timezone.now()
+            self.tournament.save(update_fields=['finished'])
+
+    def add(self, battle_log):
+        battle_log.tournament = self.tournament
+        self._buffer.append(battle_log)
+        self.battles += 1
+        if not self.quiet and battle_log.report:
+            print(battle_log.report)
+        if (len(self._buffer) >= self.flush_battles) or (
+                time.monotonic() - self._last_flush >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            with transaction.atomic():
+                if self._next_id is None:
+                    self._next_id = (BattleLog.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+                for battle_log in self._buffer:
+                    battle_log.id = self._next_id
+                    self._next_id += 1
+                BattleLog.objects.bulk_create(self._buffer)
+                BattleTurn.insert_many([
+                    (battle_log.id, number, *event)
+                    for battle_log in self._buffer
+                    for number, event in enumerate(getattr(battle_log, 'events', ()), 1)
+                ])
+                if self.tournament is not None:
+                    PokemonRecord.add_battle_logs(self.tournament, self._buffer)
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+
+def battle(resume_pokemon1=None, resume_pokemon2=None, damage_table=False, seed=None, workers=1,
+           flush_battles=1000, flush_seconds=10.0, quiet=False, compact=False):
+    """Run the Pokemon battle simulator.
+
+    The battles run against an in-memory Snapshot of the pokemon, so the
+    database is only used to store the BattleLogs. With damage_table=True, the
+    damage of all moves is computed once for the whole roster and the AI reads
+    it from the DamageTable.
+
+    With workers > 1, the battles are divided over worker processes (forked,
+    so they share the snapshot) and the results are stored by this process in
+    the same order as a serial run. Every battle has its own seed, which is
+    stored in the BattleLog. With a seed for the run, the battle seeds are
+    derived from it and the pair, so the output does not depend on the number
+    of workers.
+
+    With compact=True, the BattleLogs only store the seed and the outcome (and
+    no reports are printed), see BattleLog.get_report(). No BattleTurns are
+    stored either, so the used moves of a compact run are only counted after
+    replay_battle_turns().
+
+    The transposition table of the AI is loaded from and saved to the
+    AI_TRANSPOSITION_TABLE_FILE setting, if set. Note that the worker processes
+    have their own transposition tables, which are not saved.
+
+    The BattleLogs are written in batches, see BattleLogWriter. Note that a run
+    that is interrupted can lose the battles of the last flush interval. The
+    run is a new Tournament with its own PokemonRecords, a resumed run
+    continues the latest round-robin Tournament. The Tournament is marked as
+    finished when all its battles are stored.
+
+    With the SIMULATOR_INSTRUMENTATION setting, the hot paths are counted and
+    timed, a report is printed at the end and the summary is returned (see
+    pokemon.instrumentation). Otherwise None is returned.
+    """
+    tournament = None
+    if resume_pokemon1 and resume_pokemon2:
+        tournament = Tournament.latest(Tournament.Kind.ROUND_ROBIN)
+    if tournament is None:
+        tournament = Tournament.objects.create(kind=Tournament.Kind.ROUND_ROBIN, seed=seed)
+    writer = BattleLogWriter(flush_battles, flush_seconds, quiet, tournament)
+    if not settings.SIMULATOR_INSTRUMENTATION:
+        _run(resume_pokemon1, resume_pokemon2, damage_table, seed, workers, writer, compact)
+        return None
+    instrumentation = Instrumentation()
+    start = time.perf_counter()
+    with instrumentation.active():
+        _run(resume_pokemon1, resume_pokemon2, damage_table, seed, workers, writer, compact)
+    summary = instrumentation.summary(writer.battles, time.perf_counter() - start)
+    print(instrumentation_report(summary))
+    return summary
+
+
+def _run(resume_pokemon1, resume_pokemon2, damage_table, seed, workers, writer, compact):
+    global _snapshot
+    _snapshot = Snapshot()
+    transpositions_file = settings.AI_TRANSPOSITION_TABLE_FILE
+    versions = DataVersion.current()
+    if transpositions_file:
+        ai.load_transpositions(transpositions_file, versions)
+    pokemons = list(_snapshot.pokemon.values())
+    if damage_table:
+        table = DamageTable.build(pokemons)
+        print(table.report())
+        ai.use_damage_table(table)
+    shards = _shards(_pairs(pokemons, resume_pokemon1, resume_pokemon2), seed, compact)
+    try:
+        with writer:
+            if workers > 1:
+                connections.close_all()     # Do not share database connections with the workers.
+                context = multiprocessing.get_context('fork')
+                with context.Pool(workers, initializer=_init_worker) as pool:
+                    _store(pool.imap(_battle_shard, shards), writer)
+            else:
+                _store(map(_battle_shard, shards), writer)
+    finally:
+        ai.use_damage_table(None)
+        _snapshot = None
+        if transpositions_file:
+            ai.save_transpositions(transpositions_file, versions)
+
+
+def replay_battle_turns(tournament=None, flush_battles=1000):
+    """Store the BattleTurns of compact BattleLogs (of a tournament) by replaying them.
+
+    Only the BattleLogs without BattleTurns are replayed, so an interrupted
+    replay can be continued. Returns the number of replayed battles.
+    """
+    battle_logs = BattleLog.objects.filter(report='', seed__isnull=False, battle_turns__isnull=True)
+    if tournament is not None:
+        battle_logs = battle_logs.filter(tournament=tournament)
+    snapshot = Snapshot()
+    replayed = 0
+    rows = []
+    for battle_log in list(battle_logs.order_by('id')):     # Not iterator(), the BattleTurns are inserted meanwhile.
+        log = []
+        battle_log.replay(snapshot, log)
+        rows.extend((battle_log.id, number, *event) for number, event in enumerate(_events(log), 1))
+        replayed += 1
+        if replayed % flush_battles == 0:
+            BattleTurn.insert_many(rows)
+            rows = []
+    if rows:
+        BattleTurn.insert_many(rows)
+    return replayed
+
+
+def _store(results, writer):
+    for battle_logs in results:
+        for battle_log in battle_logs:
+            writer.add(battle_log)
 
 
 def test():
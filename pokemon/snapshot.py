@@ -0,0 +1,105 @@
+from pokemon.models import Move, Nature, Pokemon, Species, Type
+from pokemon.models.move import MoveMixin
+from pokemon.models.nature import NatureMixin
+from pokemon.models.pokemon import PokemonMixin
+from pokemon.models.species import SpeciesMixin
+from pokemon.models.type import TypeMixin, type_chart
+
+
+def _set_fields(instance, row):
+    for name, value in row.items():
+        setattr(instance, name, value)
+
+
+class TypeSnapshot(TypeMixin):
+    __slots__ = ('id', 'name')
+
+    def __init__(self, row):
+        _set_fields(self, row)
+
+
+class NatureSnapshot(NatureMixin):
+    __slots__ = ('id', 'name', 'increased_stat', 'decreased_stat')
+
+    def __init__(self, row):
+        _set_fields(self, row)
+
+
+class SpeciesSnapshot(SpeciesMixin):
+    __slots__ = (
+        'id', 'name', 'type1_id', 'type2_id', 'type1', 'type2', 'evolves_from_id',
+        'hp', 'attack', 'special_attack', 'defense', 'special_defense', 'speed'
+    )
+
+    def __init__(self, row, types):
+        _set_fields(self, row)
+        self.type1 = types[self.type1_id]
+        self.type2 = types.get(self.type2_id)
+
+
+class MoveSnapshot(MoveMixin):
+    __slots__ = (
+        'id', 'name', 'power', 'priority', 'pp', 'accuracy', 'type_id', 'type', 'drain',
+        'recoil', 'nerf_factor', 'is_noteworthy', 'damage_class'
+    )
+
+    def __init__(self, row, types):
+        _set_fields(self, row)
+        self.type = types[self.type_id]
+
+
+class PokemonSnapshot(PokemonMixin):
+    __slots__ = (
+        'id', 'species_id', 'species', 'level', 'nature_id', 'nature', 'ability_id',
+        'moves', 'current_hp', '_stats', '_move_index',
+        'iv_hp', 'iv_attack', 'iv_special_attack', 'iv_defense', 'iv_special_defense', 'iv_speed',
+        'ev_hp', 'ev_attack', 'ev_special_attack', 'ev_defense', 'ev_special_defense', 'ev_speed'
+    )
+
+    def __init__(self, row, species, natures):
+        _set_fields(self, row)
+        self.species = species[self.species_id]
+        self.nature = natures[self.nature_id]
+        self.moves = []
+
+    def usable_moves(self):
+        """Moves that do damage, the other moves are ignored by the AI."""
+        return [move for move in self.moves if move.power > 0 and move.nerf_factor > 0.0]
+
+
+def _values(model, *exclude):
+    """All rows of a model as dicts with the concrete field values."""
+    fields = [
+        field.attname for field in model._meta.concrete_fields
+        if field.name not in exclude
+    ]
+    return model.objects.order_by('pk').values(*fields)
+
+
+class Snapshot:
+    """All data needed for battles, loaded into plain in-memory objects.
+
+    The objects have the same attributes and battle logic as the models, so
+    pokemon.ai and Pokemon.battle run against them without any database
+    queries (the type effectiveness comes from the process-wide type chart).
+    Loading takes a few bulk queries.
+    """
+
+    def __init__(self):
+        type_chart()  # Make sure the process-wide type chart is loaded.
+        self.types = {row['id']: TypeSnapshot(row) for row in _values(Type)}
+        self.natures = {row['id']: NatureSnapshot(row) for row in _values(Nature)}
+        self.species = {row['id']: SpeciesSnapshot(row, self.types) for row in _values(Species)}
+        self.moves = {row['id']: MoveSnapshot(row, self.types) for row in _values(Move)}
+        self.pokemon = {
+            row['id']: PokemonSnapshot(row, self.species, self.natures)
+            for row in _values(Pokemon, 'cache')
+        }
+        # Ordered by move id, like Pokemon.usable_moves.
+        pokemon_moves = Pokemon.moves.through.objects.order_by('pokemon_id', 'move_id')
+        for pokemon_id, move_id in pokemon_moves.values_list('pokemon_id', 'move_id'):
+            self.pokemon[pokemon_id].moves.append(self.moves[move_id])
+
+    def get(self, pokemon):
+        """The snapshot of a Pokemon model instance."""
+        return self.pokemon[pokemon.id]
@@ -0,0 +1,159 @@
+from pokemon import ai
+from pokemon.ai import _damage_distribution, select_moves
+from pokemon.damage_table import DamageTable
+from pokemon.models import Matchup
+from pokemon.snapshot import Snapshot
+
+
+def _attack(hps, attacker, move, defender, damage):
+    """HP after an attack, same as Pokemon.use_move."""
+    hps = dict(hps)
+    damage_dealt = min(hps[defender], damage)
+    hps[defender] -= damage_dealt
+    hps[attacker] -= min(move.recoil_damage(damage_dealt), hps[attacker])
+    hps[attacker] += min(move.drain_recovery(damage_dealt), attacker.hp - hps[attacker])
+    return hps
+
+
+class BattleSolver:
+    """Exact probability that a pokemon wins a battle (Markov chain).
+
+    The states of the battle are the HP of both pokemon at the start of a turn.
+    In every state, the moves are chosen by select_moves (like Pokemon.battle)
+    and the damage follows ai._damage_distribution. The win probability of a
+    state depends on the states after one turn, which all have less HP in
+    total (drain heals less than the damage) or are the same state (both moves
+    missed or did no damage). Every state is solved once.
+    """
+
+    def __init__(self, pokemon, opponent):
+        self.pokemon = pokemon
+        self.opponent = opponent
+        self._transitions = {}
+        self._probabilities = {}
+
+    @property
+    def states(self):
+        """Number of solved states."""
+        return len(self._probabilities)
+
+    def _turn(self, hps, order):
+        """Outcomes of one turn: win probability and the probabilities of the next states."""
+        (attacker1, move1, defender1), (attacker2, move2, defender2) = order
+        p_win = 0.0
+        next_states = {}
+        for damage1, p1 in _damage_distribution(attacker1, move1, defender1).items():
+            hps1 = _attack(hps, attacker1, move1, defender1, damage1)
+            if hps1[defender1] == 0 or hps1[attacker1] == 0:
+                winner = attacker1 if hps1[defender1] == 0 else defender1
+                p_win += p1 if (winner is self.pokemon) else 0.0
+                continue
+            for damage2, p2 in _damage_distribution(attacker2, move2, defender2).items():
+                hps2 = _attack(hps1, attacker2, move2, defender2, damage2)
+                if hps2[defender2] == 0 or hps2[attacker2] == 0:
+                    winner = attacker2 if hps2[defender2] == 0 else defender2
+                    p_win += p1 * p2 if (winner is self.pokemon) else 0.0
+                else:
+                    state = (hps2[self.pokemon], hps2[self.opponent])
+                    next_states[state] = next_states.get(state, 0.0) + p1 * p2
+        return p_win, next_states
+
+    def transitions(self, state):
+        """Win probability within the turn and the probabilities of the next states."""
+        if state not in self._transitions:
+            pokemon, opponent = self.pokemon, self.opponent
+            pokemon.current_hp, opponent.current_hp = state
+            move, opponent_move = select_moves(pokemon, opponent)
+            first = pokemon.first(move, opponent, opponent_move)
+            order = ((pokemon, move, opponent), (opponent, opponent_move, pokemon))
+            hps = {pokemon: state[0], opponent: state[1]}
+            if first is pokemon:
+                outcomes = [(1.0, order)]
+            elif first is opponent:
+                outcomes = [(1.0, order[::-1])]
+            else:
+                outcomes = [(0.5, order), (0.5, order[::-1])]
+            p_win = 0.0
+            next_states = {}
+            for p_order, order in outcomes:
+                p_turn_win, turn_next_states = self._turn(hps, order)
+                p_win += p_order * p_turn_win
+                for next_state, probability in turn_next_states.items():
+                    next_states[next_state] = next_states.get(next_state, 0.0) + p_order * probability
+            self._transitions[state] = (p_win, next_states)
+        return self._transitions[state]
+
+    def _solve_state(self, state):
+        p_win, next_states = self.transitions(state)
+        p_stay = next_states.get(state, 0.0)
+        p_win += sum(
+            probability * self._probabilities[next_state]
+            for next_state, probability in next_states.items()
+            if next_state != state
+        )
+        if p_stay >= 1.0:
+            return 0.0  # The battle never ends.
+        return p_win / (1.0 - p_stay)
+
+    def win_probability(self, hp=None, opponent_hp=None):
+        """Probability that the pokemon wins, by default starting at full HP."""
+        start = (
+            self.pokemon.hp if hp is None else hp,
+            self.opponent.hp if opponent_hp is None else opponent_hp
+        )
+        stack = [start]
+        while stack:  # Depth first, without recursion (battles can take many turns).
+            state = stack[-1]
+            if state in self._probabilities:
+                stack.pop()
+                continue
+            _p_win, next_states = self.transitions(state)
+            unsolved = [
+                next_state for next_state in next_states
+                if next_state != state and next_state not in self._probabilities
+            ]
+            if unsolved:
+                stack.extend(unsolved)
+            else:
+                self._probabilities[state] = self._solve_state(state)
+                stack.pop()
+        return self._probabilities[start]
+
+
+def win_probability(pokemon, opponent):
+    """Exact probability that the pokemon wins pokemon.battle(opponent)."""
+    return BattleSolver(pokemon, opponent).win_probability()
+
+
+def solve_matchups(damage_table=True, save_every=1000, resume=False):
+    """Solve the battles of all ordered pairs and store the win probabilities.
+
+    The probabilities are saved every save_every pairs, so an interrupted run
+    only loses the last batch. With resume=True, the pairs that already have
+    a win probability are skipped (only use it when the pokemon data has not
+    changed since). Returns the number of solved pairs.
+    """
+    snapshot = Snapshot()
+    pokemons = list(snapshot.pokemon.values())
+    matchups = Matchup.for_pairs(
+        (pokemon.id, opponent.id)
+        for pokemon in pokemons
+        for opponent in pokemons
+        if pokemon is not opponent
+    )
+    if resume:
+        matchups = {pair: matchup for pair, matchup in matchups.items() if matchup.win_probability is None}
+    if damage_table:
+        ai.use_damage_table(DamageTable.build(pokemons))
+    batch = []
+    try:
+        for (pokemon_id, opponent_id), matchup in matchups.items():
+            matchup.win_probability = win_probability(snapshot.pokemon[pokemon_id], snapshot.pokemon[opponent_id])
+            batch.append(matchup)
+            if len(batch) >= save_every:
+                Matchup.save_all(batch, ['win_probability'])
+                batch = []
+    finally:
+        ai.use_damage_table(None)
+    Matchup.save_all(batch, ['win_probability'])
+    return len(matchups)
@@ -0,0 +1,128 @@
+import math
+
+import numpy as np
+
+from pokemon import simulator
+from pokemon.models import Tournament
+from pokemon.simulator import BattleLogWriter
+from pokemon.snapshot import Snapshot
+
+ELO_SCALE = 400 / math.log(10)   # Elo points per unit of the Bradley-Terry log-strength.
+Z = 1.96                         # 95% confidence intervals.
+
+
+class BradleyTerry:
+    """Bradley-Terry ratings, fitted from the win counts of all pairs.
+
+    The probability that i beats j is p_i / (p_i + p_j). Every player also has
+    `prior` virtual wins and losses against a reference player with strength 1,
+    so players that won or lost every battle still get a finite rating. The
+    fit is the MM algorithm, started from the previous ratings, so refitting
+    after a few more battles takes only a few iterations.
+    """
+
+    def __init__(self, ids, prior=1.0):
+        self.ids = list(ids)
+        self.index = {id: i for i, id in enumerate(self.ids)}
+        self.prior = prior
+        self.wins = np.zeros((len(self.ids), len(self.ids)))    # wins[i, j]: i beat j
+        self.strengths = np.ones(len(self.ids))
+
+    def add(self, winner_id, loser_id):
+        self.wins[self.index[winner_id], self.index[loser_id]] += 1
+
+    @property
+    def battles(self):
+        return int(self.wins.sum())
+
+    def fit(self, tolerance=1e-6, max_iterations=1000):
+        games = self.wins + self.wins.T
+        total_wins = self.wins.sum(axis=1) + self.prior
+        p = self.strengths
+        for _ in range(max_iterations):
+            denominator = (games / (p[:, None] + p[None, :])).sum(axis=1) + 2 * self.prior / (p + 1)
+            new_p = total_wins / denominator
+            converged = np.max(np.abs(np.log(new_p) - np.log(p))) < tolerance
+            p = new_p
+            if converged:
+                break
+        self.strengths = p
+        return self
+
+    @property
+    def ratings(self):
+        """Log-strengths on the Elo scale (0 is the reference player)."""
+        return ELO_SCALE * np.log(self.strengths)
+
+    @property
+    def errors(self):
+        """Half-widths of the confidence intervals of the ratings (Elo scale).
+
+        From the diagonal of the Fisher information, so the covariance between
+        the ratings is ignored.
+        """
+        p = self.strengths
+        games = self.wins + self.wins.T
+        q = p[:, None] / (p[:, None] + p[None, :])
+        q_reference = p / (p + 1)
+        information = (games * q * (1 - q)).sum(axis=1) + 2 * self.prior * q_reference * (1 - q_reference)
+        return ELO_SCALE * Z / np.sqrt(information)
+
+    def ranking(self):
+        """(id, rating, error) of all players, the highest rating first."""
+        ratings, errors = self.ratings, self.errors
+        order = np.argsort(-ratings, kind='stable')
+        return [(self.ids[i], float(ratings[i]), float(errors[i])) for i in order]
+
+
+def swiss_pairs(model, played):
+    """Pairs of the next Swiss round: neighbours in the ranking that met the least.
+
+    Every player is paired with the nearest lower ranked player, preferring
+    opponents it has played less often (`played` counts the meetings of a
+    pair). With an odd number of players the lowest unpaired player sits out.
+    """
+    ranking = [id for id, _rating, _error in model.ranking()]
+    unpaired = list(ranking)
+    pairs = []
+    while len(unpaired) > 1:
+        pokemon = unpaired.pop(0)
+        candidates = unpaired[:8]   # Only look at the nearest few in the ranking.
+        opponent = min(candidates, key=lambda id: played.get(frozenset((pokemon, id)), 0))
+        unpaired.remove(opponent)
+        pairs.append((pokemon, opponent))
+    return pairs
+
+
+def swiss_tournament(max_error=100.0, coverage=0.95, max_rounds=200, seed=None, flush_battles=1000,
+                     flush_seconds=10.0, quiet=True, compact=True):
+    """Rank all pokemon with Swiss rounds instead of a full round-robin.
+
+    Every round, the pokemon are paired with pokemon of a similar rating
+    (the most informative battles) and the Bradley-Terry ratings are refitted.
+    The tournament stops when the ratings of a fraction `coverage` of the
+    pokemon are known within max_error Elo points (95% confidence), or after
+    max_rounds. Not all of them, because the pokemon at the very top or
+    bottom (e.g. without damaging moves) win or lose every battle, which
+    hardly narrows their intervals. The battles are stored as BattleLogs of a
+    new Tournament, like simulator.battle. Returns the fitted BradleyTerry
+    model, its `battles` is the number of battles that were used.
+    """
+    snapshot = Snapshot()
+    model = BradleyTerry(snapshot.pokemon)
+    played = {}
+    tournament = Tournament.objects.create(kind=Tournament.Kind.SWISS, seed=seed)
+    with BattleLogWriter(flush_battles, flush_seconds, quiet, tournament) as writer:
+        for round_number in range(max_rounds):
+            round_seed = None if seed is None else f'{seed}:{round_number}'
+            for id1, id2 in swiss_pairs(model, played):
+                battle_log = simulator._battle(
+                    snapshot.pokemon[id1], snapshot.pokemon[id2], round_seed, compact)
+                writer.add(battle_log)
+                model.add(battle_log.winner_id, battle_log.loser_id)
+                pair = frozenset((id1, id2))
+                played[pair] = played.get(pair, 0) + 1
+            model.fit()
+            if np.quantile(model.errors, coverage) <= max_error:
+                break
+    return model
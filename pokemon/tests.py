@@ -1,5 +1,31 @@
-from django.test import TestCase
-from pokemon.models import Nature, Species, Pokemon, Type, Move, Ability
+import contextlib
+import http.server
+import importlib
+import io
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import urllib.error
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.contrib.admin import AdminSite
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from pokemon import ai, benchmark, load, instrumentation, montecarlo, pokemon_cache, simulator, solver, swiss
+from pokemon.cache import LRUCache
+from pokemon.damage_table import DamageTable
+from pokemon.pokeapi import PokeAPI
+from pokemon.admin import PokemonAdmin
+from pokemon.models import Nature, Species, Pokemon, Type, Move, Ability, BattleLog, BattleTurn, DataVersion, Matchup, Tournament
+from pokemon.models.pokemon import PokemonMixin, STATS
+from pokemon.snapshot import Snapshot
 
 
 class PokemonTestCase(TestCase):
@@ -100,3 +126,740 @@ class PokemonTestCase(TestCase):
         )
         damage = move.max_damage(attacker=self.attacker, defender=self.defender)
         self.assertEqual(damage, 0)
+
+
+class AITestCase(TestCase):
+    def setUp(self):
+        nature = Nature.objects.create(name='quirky')
+        ability = Ability.objects.create(name='overgrow')
+        normal = Type.objects.create(name='normal')
+        fire = Type.objects.create(name='fire')
+        water = Type.objects.create(name='water')
+        grass = Type.objects.create(name='grass')
+        fire.weaknesses.add(water)
+        fire.resistances.add(fire, grass)
+        water.weaknesses.add(grass)
+        water.resistances.add(fire, water)
+        grass.weaknesses.add(fire)
+        grass.resistances.add(water, grass)
+        species = [
+            Species.objects.create(
+                id=1, name='bulbasaur', type1=grass, hp=45, attack=49, defense=49,
+                special_attack=65, special_defense=65, speed=45),
+            Species.objects.create(
+                id=4, name='charmander', type1=fire, hp=39, attack=52, defense=43,
+                special_attack=60, special_defense=50, speed=65),
+            Species.objects.create(
+                id=7, name='squirtle', type1=water, hp=44, attack=48, defense=65,
+                special_attack=50, special_defense=64, speed=43),
+            Species.objects.create(
+                id=19, name='rattata', type1=normal, hp=30, attack=56, defense=35,
+                special_attack=25, special_defense=35, speed=72),
+        ]
+
+        def move(name, type, power, accuracy=100, priority=0, drain=0, recoil=0, damage_class='PH'):
+            return Move.objects.create(
+                name=name, type=type, power=power, accuracy=accuracy, priority=priority,
+                pp=10, drain=drain, recoil=recoil, damage_class=damage_class)
+
+        tackle = move('tackle', normal, 40)
+        quick_attack = move('quick-attack', normal, 40, priority=1)
+        double_edge = move('double-edge', normal, 120, recoil=33)
+        ember = move('ember', fire, 40, damage_class='SP')
+        flamethrower = move('flamethrower', fire, 95, damage_class='SP')
+        water_gun = move('water-gun', water, 40, damage_class='SP')
+        hydro_pump = move('hydro-pump', water, 120, accuracy=80, damage_class='SP')
+        vine_whip = move('vine-whip', grass, 35)
+        giga_drain = move('giga-drain', grass, 60, drain=50, damage_class='SP')
+        movesets = {
+            'bulbasaur': [tackle, double_edge, vine_whip, giga_drain],
+            'charmander': [tackle, ember, flamethrower],
+            'squirtle': [tackle, water_gun, hydro_pump],
+            'rattata': [tackle, quick_attack, double_edge],
+        }
+        self.pokemon = {}
+        for s in species:
+            pokemon = Pokemon.objects.create(species=s, ability=ability, nature=nature)
+            pokemon.moves.set(movesets[s.name])
+            pokemon.current_hp = pokemon.hp
+            self.pokemon[s.name] = pokemon
+
+    def _matchups(self):
+        """All combinations of two fixture pokemon with one of their moves each."""
+        for pokemon in self.pokemon.values():
+            for opponent in self.pokemon.values():
+                if pokemon != opponent:
+                    for move in pokemon.moves.all():
+                        for opponent_move in opponent.moves.all():
+                            yield pokemon, move, opponent, opponent_move
+
+    def test_faint_cdf_matches_reference(self):
+        """The array engine gives the same faint probabilities as the dict path."""
+        self.pokemon['bulbasaur'].current_hp = 20
+        for pokemon, move, opponent, opponent_move in self._matchups():
+            for is_selecting in (True, False):
+                args = (pokemon, move, opponent, opponent_move, is_selecting)
+                for p1, p2 in zip(ai._faint_cdf(*args), ai._faint_cdf_reference(*args)):
+                    self.assertAlmostEqual(p1, p2, delta=ai.TOLERANCE)
+
+    def test_adaptive_horizon(self):
+        """The faint distribution stops once the opponent has certainly fainted."""
+        bulbasaur, charmander = self.pokemon['bulbasaur'], self.pokemon['charmander']
+        tackle = charmander.moves.get(name='tackle')
+        vine_whip = bulbasaur.moves.get(name='vine-whip')
+        ai.clear_caches()
+        bulbasaur.current_hp = 30
+        args = (charmander, tackle, bulbasaur, vine_whip, True)
+        cdf = ai._faint_cdf(*args)
+        for p1, p2 in zip(cdf, ai._faint_cdf_reference(*args)):
+            self.assertAlmostEqual(p1, p2, delta=ai.TOLERANCE)
+        self.assertEqual(cdf[-1], 1.0)
+        self.assertEqual(ai.horizon_info()['early_exits'], 1)
+        self.assertGreater(ai.horizon_info()['convolutions_saved'], 0)
+
+    def test_faint_distribution_cache(self):
+        """Repeated evaluations reuse the cached faint distributions."""
+        bulbasaur, charmander = self.pokemon['bulbasaur'], self.pokemon['charmander']
+        vine_whip = bulbasaur.moves.get(name='vine-whip')
+        ember = charmander.moves.get(name='ember')
+        ai.clear_caches()
+        p_win = ai.win_probability(bulbasaur, vine_whip, charmander, ember)
+        info = ai.cache_info()['faint_distribution']
+        self.assertEqual(ai.win_probability(bulbasaur, vine_whip, charmander, ember), p_win)
+        self.assertEqual(ai.cache_info()['faint_distribution']['misses'], info['misses'])
+        self.assertGreater(ai.cache_info()['faint_distribution']['hits'], info['hits'])
+
+    def test_cache_eviction(self):
+        """The least recently used entry is evicted when the cache is full."""
+        cache = LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+        self.assertNotIn('b', cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.info()['hits'], 1)
+
+    def test_win_probability_matches_reference(self):
+        """The linear evaluation gives the same win probability as the pair loop."""
+        self.pokemon['squirtle'].current_hp = 30
+        for pokemon, move, opponent, opponent_move in self._matchups():
+            self.assertAlmostEqual(
+                ai.win_probability(pokemon, move, opponent, opponent_move),
+                ai._win_probability_reference(pokemon, move, opponent, opponent_move),
+                delta=ai.TOLERANCE
+            )
+
+    def test_damage_table(self):
+        """The damage table has the same damage as Move.true_damage."""
+        table = DamageTable.build(self.pokemon.values())
+        for pokemon, move, opponent, _opponent_move in self._matchups():
+            self.assertEqual(
+                table.rolls(pokemon, move, opponent),
+                [move.true_damage(pokemon, opponent, i) for i in range(85, 101)]
+            )
+        bulbasaur, rattata = self.pokemon['bulbasaur'], self.pokemon['rattata']
+        move = ai.select_move(bulbasaur, rattata)
+        ai.clear_caches()
+        ai.use_damage_table(table)
+        try:
+            self.assertEqual(ai.select_move(bulbasaur, rattata), move)
+        finally:
+            ai.use_damage_table(None)
+
+    def test_snapshot_battle(self):
+        """A battle between snapshots gives the same result without any queries."""
+        bulbasaur, charmander = self.pokemon['bulbasaur'], self.pokemon['charmander']
+        random.seed(7)
+        _winner, report = bulbasaur.battle(charmander)
+        snapshot = Snapshot()
+        random.seed(7)
+        with self.assertNumQueries(0):
+            _winner, snapshot_report = snapshot.get(bulbasaur).battle(snapshot.get(charmander))
+        self.assertEqual(snapshot_report, report)
+
+    def test_snapshot_move_order(self):
+        """Snapshots and models order the moves by id, also when they were added in another order."""
+        rattata, bulbasaur = self.pokemon['rattata'], self.pokemon['bulbasaur']
+        tackle = Move.objects.get(name='tackle')
+        scratch = Move.objects.create(
+            name='scratch', type=tackle.type, power=40, accuracy=100, priority=0, pp=10, drain=0, recoil=0,
+            damage_class='PH')
+        rattata.moves.clear()
+        rattata.moves.add(scratch)
+        rattata.moves.add(tackle)   # Equal to scratch, but with the lower id.
+        snapshot = Snapshot()
+        self.assertEqual([move.name for move in rattata.usable_moves()], ['tackle', 'scratch'])
+        self.assertEqual([move.name for move in snapshot.get(rattata).usable_moves()], ['tackle', 'scratch'])
+        _winner, report = rattata.battle(bulbasaur, rng=random.Random(3))
+        _winner, snapshot_report = snapshot.get(rattata).battle(snapshot.get(bulbasaur), rng=random.Random(3))
+        self.assertEqual(snapshot_report, report)
+        self.assertIn('rattata uses tackle', report)
+        self.assertNotIn('scratch', report)
+
+    def test_type_chart(self):
+        """The type chart is loaded once and reloaded after the types are edited."""
+        fire = Type.objects.get(name='fire')
+        water = Type.objects.get(name='water')
+        squirtle = Species.objects.get(name='squirtle')
+        charmander = Species.objects.get(name='charmander')
+        self.assertEqual(charmander.effectiveness(water), 2.0)
+        with self.assertNumQueries(0):
+            self.assertEqual(squirtle.effectiveness(fire), 0.5)
+            self.assertEqual(fire.effectiveness(water), 0.5)
+        fire.weaknesses.remove(water)
+        self.assertEqual(charmander.effectiveness(water), 1.0)
+
+    def test_stat_block(self):
+        """The stats are computed once and recomputed after a change."""
+        rattata = self.pokemon['rattata']
+        hp = rattata.hp
+        with mock.patch.object(PokemonMixin, '_stat', autospec=True, side_effect=PokemonMixin._stat) as stat:
+            self.assertEqual(rattata.hp, hp)
+            ai.select_move(rattata, self.pokemon['bulbasaur'])
+            self.assertEqual(stat.call_count, 0)
+            rattata.ev_hp = 252
+            self.assertGreater(rattata.hp, hp)
+            self.assertEqual(stat.call_count, len(STATS))
+
+    def test_stat_change_clears_ai_caches(self):
+        """The AI caches are keyed on ids, so they are cleared when a pokemon with other stats is saved."""
+        rattata, squirtle = self.pokemon['rattata'], self.pokemon['squirtle']
+        tackle = Move.objects.get(name='tackle')
+        before = ai.win_probability(rattata, tackle, squirtle, tackle)
+        with mock.patch.object(ai, 'clear_caches') as clear_caches:
+            rattata.level = 100     # Only the StatBlock, an unsaved change does not clear the AI caches.
+            self.assertFalse(clear_caches.called)
+        self.assertEqual(ai.win_probability(rattata, tackle, squirtle, tackle), before)
+        rattata.save()
+        after = ai.win_probability(rattata, tackle, squirtle, tackle)
+        self.assertGreater(after, before)
+        twin = Pokemon.objects.get(pk=rattata.pk)
+        twin.current_hp = twin.hp
+        self.assertEqual(ai.win_probability(twin, tackle, squirtle, tackle), after)
+
+    def test_parallel_tournament(self):
+        """A seeded tournament gives the same BattleLogs with several workers."""
+        reports = []
+        for workers in (1, 2):
+            BattleLog.objects.all().delete()
+            simulator.battle(seed=42, workers=workers, quiet=True)
+            reports.append(list(
+                BattleLog.objects.order_by('id').values_list('winner', 'loser', 'report')
+            ))
+        self.assertEqual(len(reports[0]), 12)
+        self.assertEqual(reports[1], reports[0])
+        # Without fork (e.g. on Windows) the workers cannot share the snapshot.
+        with mock.patch('multiprocessing.get_all_start_methods', return_value=['spawn']):
+            with self.assertRaisesMessage(CommandError, 'requires the fork start method'):
+                call_command('run_tournament', workers=2, quiet=True)
+
+    def test_bradley_terry(self):
+        """The fitted ratings recover the order of known strengths."""
+        rng = random.Random(0)
+        strengths = {1: 4.0, 2: 2.0, 3: 1.0, 4: 0.5}
+        model = swiss.BradleyTerry(strengths)
+        for _ in range(2000):
+            i, j = rng.sample(list(strengths), 2)
+            if rng.random() < strengths[i] / (strengths[i] + strengths[j]):
+                model.add(i, j)
+            else:
+                model.add(j, i)
+        ranking = model.fit().ranking()
+        self.assertEqual([id for id, _rating, _error in ranking], [1, 2, 3, 4])
+        ratings = dict((id, rating) for id, rating, _error in ranking)
+        for id, error in zip(model.ids, model.errors):
+            expected = (ratings[id] - ratings[3]) / swiss.ELO_SCALE
+            self.assertLess(abs(expected - math.log(strengths[id])), 0.2)
+            self.assertLess(error, 100)
+
+    def test_swiss_tournament(self):
+        """The Swiss tournament stores its battles and stops at max_rounds."""
+        model = swiss.swiss_tournament(max_error=0.0, max_rounds=3, seed=1)
+        self.assertEqual(model.battles, 6)   # 2 pairs per round
+        self.assertEqual(BattleLog.objects.count(), 6)
+        self.assertEqual(len(model.ranking()), 4)
+
+    def test_wilson_interval(self):
+        """The sequential test stops early for lopsided win rates."""
+        low, high = montecarlo.wilson_interval(50, 100)
+        self.assertAlmostEqual(low, 0.4038, places=4)
+        self.assertAlmostEqual(high, 0.5962, places=4)
+        self.assertTrue(montecarlo.is_resolved(0, 40, 0.05))
+        self.assertFalse(montecarlo.is_resolved(20, 40, 0.05))
+
+    def test_sample_matchups(self):
+        """Sampled win rates agree with the exact solver and are stored as counts."""
+        charmander, bulbasaur = self.pokemon['charmander'], self.pokemon['bulbasaur']
+        wins, battles = montecarlo.sample_matchup(charmander, bulbasaur, precision=0.1, seed=1)
+        self.assertLess(battles, 1000)
+        low, high = montecarlo.wilson_interval(wins, battles)
+        self.assertTrue(low - 0.05 <= solver.win_probability(charmander, bulbasaur) <= high + 0.05)
+        # An interrupted run keeps the counts of the saved batches.
+        sample_matchup = montecarlo.sample_matchup
+        calls = []
+
+        def interrupted(*args):
+            calls.append(args)
+            if len(calls) == 6:
+                raise KeyboardInterrupt
+            return sample_matchup(*args)
+
+        with mock.patch.object(montecarlo, 'sample_matchup', interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                montecarlo.sample_matchups(precision=0.2, max_battles=50, seed=1, save_every=4)
+        self.assertEqual(Matchup.objects.filter(battles__gt=0).count(), 4)
+        saved = sum(Matchup.objects.values_list('battles', flat=True))
+        battles = montecarlo.sample_matchups(precision=0.2, max_battles=50, seed=1)
+        self.assertEqual(Matchup.objects.count(), 12)
+        self.assertEqual(sum(Matchup.objects.values_list('battles', flat=True)), saved + battles)
+        self.assertEqual(BattleLog.objects.count(), 0)
+        self.assertEqual(montecarlo.sample_matchups(precision=0.2, max_battles=50, seed=1), 0)
+
+    def test_pokemon_records(self):
+        """A tournament keeps the results per pokemon, which the admin orders by."""
+        simulator.battle(seed=1, quiet=True, flush_battles=5)
+        tournament = Tournament.latest()
+        records = {record.pokemon_id: record for record in tournament.records.all()}
+        for pokemon in self.pokemon.values():
+            record = records[pokemon.id]
+            self.assertEqual(record.wins, pokemon.wins.count())
+            self.assertEqual(record.losses, pokemon.losses.count())
+            self.assertEqual(record.battles, 6)
+            self.assertEqual(record.win_percentage, round(record.wins / 6 * 100, 2))
+        pokemon_admin = PokemonAdmin(Pokemon, AdminSite())
+        with self.assertNumQueries(2):
+            pokemons = list(pokemon_admin.get_queryset(None))
+            percentages = [pokemon_admin.win_percentage(pokemon) for pokemon in pokemons]
+        self.assertEqual(percentages, sorted(
+            (record.win_percentage for record in records.values()), reverse=True))
+        self.assertIsNotNone(tournament.finished)
+
+    def test_backfill_battle_turns(self):
+        """The migration parses the reports of the existing BattleLogs into the same BattleTurns."""
+        migration = importlib.import_module('pokemon.migrations.0017_backfill_battleturns')
+        simulator.battle(seed=1, quiet=True)
+        fields = ['battle_log_id', 'number', 'attacker_id', 'move_id', 'damage', 'hp_left']
+        turns = list(BattleTurn.objects.order_by('battle_log_id', 'number').values_list(*fields))
+        BattleTurn.objects.all().delete()
+        schema_editor = mock.Mock(connection=connection)   # Only its connection is used.
+        migration.backfill_battle_turns(django_apps, schema_editor)
+        migration.backfill_battle_turns(django_apps, schema_editor)     # Only once
+        self.assertEqual(list(BattleTurn.objects.order_by('battle_log_id', 'number').values_list(*fields)), turns)
+
+    def test_tournament_selection(self):
+        """The admin shows the latest finished round-robin, unless another tournament is chosen."""
+        simulator.battle(seed=1, quiet=True)
+        round_robin = Tournament.latest()
+        swiss.swiss_tournament(max_rounds=1, seed=1, quiet=True)
+        running = Tournament.objects.create(kind=Tournament.Kind.ROUND_ROBIN)
+        self.assertEqual(Tournament.latest(), running)
+        pokemon_admin = PokemonAdmin(Pokemon, AdminSite())
+
+        def percentages(request):
+            return {pokemon.id: pokemon_admin.win_percentage(pokemon) for pokemon in pokemon_admin.get_queryset(request)}
+
+        expected = {record.pokemon_id: record.win_percentage for record in round_robin.records.all()}
+        self.assertEqual(percentages(RequestFactory().get('/')), expected)
+        request = RequestFactory().get('/', {'tournament': running.id})
+        self.assertEqual(set(percentages(request).values()), {None})
+        request = RequestFactory().get('/admin/pokemon/pokemon/')
+        request.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        response = pokemon_admin.changelist_view(request)
+        self.assertContains(response, f'?tournament={round_robin.id}')
+        self.assertContains(response, 'unfinished')
+
+    def test_battle_turns(self):
+        """Every move in a battle is stored as a BattleTurn, the admin counts them with one query per page."""
+        simulator.battle(seed=1, quiet=True)
+        tournament = Tournament.latest()
+        simulator.battle(seed=2, quiet=True)
+        for battle_log in BattleLog.objects.all():
+            turns = list(battle_log.battle_turns.order_by('number'))
+            self.assertEqual((len(turns) + 1) // 2, battle_log.turns)
+            # The defender fainted, or the attacker by recoil damage.
+            self.assertTrue(turns[-1].hp_left == 0 or turns[-1].attacker_id == battle_log.loser_id)
+            for turn in turns:
+                self.assertIn(f'{turn.attacker} uses {turn.move} with {turn.damage} ', battle_log.report)
+        pokemon_admin = PokemonAdmin(Pokemon, AdminSite())
+        pokemon_cache.recompute()
+        pokemons = list(pokemon_admin.get_queryset(None))
+        with self.assertNumQueries(2):  # The data versions and the counts.
+            pokemon_admin.prepare(pokemons, tournament)
+        with self.assertNumQueries(0):
+            used_moves = [pokemon_admin.used_moves(pokemon) for pokemon in pokemons]
+        rattata = self.pokemon['rattata']
+        # Only the moves of the selected tournament, like the win percentages.
+        expected = BattleTurn.objects.filter(attacker=rattata, battle_log__tournament=tournament).count()
+        self.assertLess(expected, BattleTurn.objects.filter(attacker=rattata).count())
+        counts = used_moves[[pokemon.id for pokemon in pokemons].index(rattata.id)]
+        self.assertEqual(sum(int(count.split(': ')[1]) for count in counts.split(', ')), expected)
+
+    def test_pokemon_cache(self):
+        """Cache entries are recomputed in bulk, and again when the data they depend on changes."""
+        with self.assertNumQueries(5):
+            self.assertEqual(pokemon_cache.recompute(), 4)
+        rattata = Pokemon.objects.get(species__name='rattata')
+        self.assertEqual(pokemon_cache.get(rattata, 'noteworthy'), '')
+        double_edge = Move.objects.get(name='double-edge')
+        double_edge.is_noteworthy = True
+        double_edge.save()
+        self.assertEqual(pokemon_cache.get(rattata, 'noteworthy'), 'double-edge')
+        rattata.moves.remove(double_edge)
+        self.assertEqual(pokemon_cache.get(rattata, 'noteworthy'), '')
+        Species.objects.create(
+            id=20, name='raticate', type1=rattata.species.type1, evolves_from=rattata.species,
+            hp=55, attack=81, defense=60, special_attack=50, special_defense=70, speed=97)
+        self.assertEqual(pokemon_cache.get(rattata, 'evolutions'), 'raticate')
+        self.assertEqual(Pokemon.objects.get(id=rattata.id).cache['evolutions']['value'], 'raticate')
+
+    def test_instrumentation(self):
+        """With the setting, a tournament reports the calls and durations of the hot paths."""
+        output = io.StringIO()
+        with self.settings(SIMULATOR_INSTRUMENTATION=True), contextlib.redirect_stdout(output):
+            summary = simulator.battle(seed=1, quiet=True)
+        self.assertIn('select_moves', output.getvalue())
+        self.assertEqual(summary['battles'], 12)
+        phases = summary['phases']
+        self.assertEqual(phases['battlelog_write']['calls'], 1)
+        self.assertGreater(phases['select_moves']['calls'], 0)
+        self.assertGreater(phases['win_probability']['calls'], 0)
+        self.assertGreater(phases['orm_query']['calls'], 0)
+        self.assertIsNotNone(phases['select_moves']['p99_ms'])
+        self.assertIn('select_moves', instrumentation.report(summary))
+        self.assertEqual(json.loads(instrumentation.to_json(summary))['battles'], 12)
+        self.assertFalse(hasattr(ai.select_moves, '__wrapped__'))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'summary.json')
+            with self.assertRaises(CommandError):
+                call_command('run_tournament', quiet=True, summary_json=path)
+            with self.settings(SIMULATOR_INSTRUMENTATION=True), contextlib.redirect_stdout(io.StringIO()):
+                call_command('run_tournament', quiet=True, seed=1, summary_json=path, stdout=io.StringIO())
+            with open(path) as f:
+                self.assertEqual(json.load(f)['battles'], 12)
+
+    def test_battle_log_writer(self):
+        """BattleLogs are stored in batches and the rest when the writer closes."""
+        bulbasaur, rattata = self.pokemon['bulbasaur'], self.pokemon['rattata']
+        with simulator.BattleLogWriter(flush_battles=2, quiet=True) as writer:
+            for _ in range(3):
+                writer.add(BattleLog(winner=bulbasaur, loser=rattata, report='report'))
+            self.assertEqual(BattleLog.objects.count(), 2)
+        self.assertEqual(BattleLog.objects.count(), 3)
+
+    def test_compact_battle_log(self):
+        """A compact BattleLog regenerates the report by replaying the battle."""
+        simulator.battle(seed=3, quiet=True)
+        reports = list(BattleLog.objects.order_by('id').values_list('report', flat=True))
+        BattleLog.objects.all().delete()
+        simulator.battle(seed=3, compact=True)
+        battle_logs = BattleLog.objects.order_by('id')
+        self.assertEqual([battle_log.report for battle_log in battle_logs], [''] * len(reports))
+        self.assertEqual([battle_log.get_report() for battle_log in battle_logs], reports)
+        # No BattleTurns, until they are replayed (once).
+        self.assertEqual(BattleTurn.objects.count(), 0)
+        self.assertEqual(simulator.replay_battle_turns(Tournament.latest()), len(reports))
+        self.assertEqual(simulator.replay_battle_turns(), 0)
+        for battle_log, report in zip(battle_logs, reports):
+            for turn in battle_log.battle_turns.all():
+                self.assertIn(f'{turn.attacker} uses {turn.move} with {turn.damage} ', report)
+            self.assertEqual((battle_log.battle_turns.count() + 1) // 2, battle_log.turns)
+        for battle_log in battle_logs:
+            self.assertTrue(battle_log.get_report().endswith(
+                f'{battle_log.winner} wins with '
+                f'{battle_log.hp_left / battle_log.winner.hp * 100:.2f}% HP left.\n'
+            ))
+
+    def test_compact_battle_log_move_order(self):
+        """The replay of a compact log takes the moves in the order of the simulator."""
+        rattata, bulbasaur = self.pokemon['rattata'], self.pokemon['bulbasaur']
+        tackle = Move.objects.get(name='tackle')
+        scratch = Move.objects.create(
+            name='scratch', type=tackle.type, power=40, accuracy=100, priority=0, pp=10, drain=0, recoil=0,
+            damage_class='PH')
+        rattata.moves.clear()
+        rattata.moves.add(scratch)
+        rattata.moves.add(tackle)
+        snapshot = Snapshot()
+        full_log = simulator._battle(snapshot.get(rattata), snapshot.get(bulbasaur), seed=1, compact=False)
+        compact_log = simulator._battle(snapshot.get(rattata), snapshot.get(bulbasaur), seed=1, compact=True)
+        compact_log.save()
+        self.assertEqual(BattleLog.objects.get(pk=compact_log.pk).get_report(), full_log.report)
+        self.assertEqual(compact_log.get_report(snapshot), full_log.report)
+
+    def test_exact_win_probability(self):
+        """The exact win probability of a battle of a pokemon against itself is 0.5."""
+        rattata = self.pokemon['rattata']
+        twin = Pokemon.objects.get(pk=rattata.pk)
+        twin.pk = None
+        twin.save()
+        twin.moves.set(rattata.moves.all())
+        self.assertAlmostEqual(solver.win_probability(rattata, twin), 0.5)
+        # An interrupted run keeps the saved batches, a resumed run solves the others.
+        with mock.patch.object(solver, 'win_probability', side_effect=[0.5] * 7 + [KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                solver.solve_matchups(save_every=3)
+        self.assertEqual(Matchup.objects.filter(win_probability__isnull=False).count(), 6)
+        self.assertEqual(solver.solve_matchups(resume=True), 20 - 6)
+        self.assertEqual(solver.solve_matchups(), 20)
+        matchups = Matchup.objects.filter(pokemon=self.pokemon['squirtle'])
+        self.assertEqual(matchups.count(), 4)
+        for matchup in matchups:
+            self.assertAlmostEqual(
+                matchup.win_probability,
+                solver.win_probability(matchup.pokemon, matchup.opponent)
+            )
+
+    def test_move_index(self):
+        """Weaker moves of the same type and partition are left out of the move index."""
+        charmander = self.pokemon['charmander']
+        tackle, ember, flamethrower = (
+            charmander.moves.get(name=name) for name in ('tackle', 'ember', 'flamethrower'))
+        groups = ai._build_move_index([tackle, flamethrower, ember])
+        self.assertEqual(sorted(len(group) for group in groups.values()), [1, 1])
+        self.assertNotIn(ember, [move for group in groups.values() for move in group])
+        self.assertEqual(len(ai._candidate_moves(charmander)), 3)
+        charmander.moves.remove(ember)
+        self.assertEqual(len(ai._candidate_moves(charmander)), 2)
+
+    def test_select_moves(self):
+        """The joint selection gives the same moves as select_move for both sides."""
+        pokemons = list(self.pokemon.values())
+        for pokemon in pokemons:
+            for opponent in pokemons:
+                if pokemon is opponent:
+                    continue
+                for hp, opponent_hp in ((None, None), (10, 25)):
+                    pokemon.current_hp = hp or pokemon.hp
+                    opponent.current_hp = opponent_hp or opponent.hp
+                    ai.clear_caches()
+                    moves = ai.select_moves(pokemon, opponent)
+                    ai.clear_caches()
+                    self.assertEqual(
+                        moves, (ai.select_move(pokemon, opponent), ai.select_move(opponent, pokemon)))
+        for pokemon, move, opponent, opponent_move in self._matchups():
+            p_win, p_lose = ai._win_probabilities(pokemon, move, opponent, opponent_move)
+            self.assertAlmostEqual(
+                p_lose, ai.win_probability(opponent, opponent_move, pokemon, move), delta=ai.TOLERANCE)
+
+    def test_transposition_table(self):
+        """Selected moves are looked up in the transposition table, also after a save and load."""
+        bulbasaur, squirtle = self.pokemon['bulbasaur'], self.pokemon['squirtle']
+        ai.clear_caches()
+        move = ai.select_move(bulbasaur, squirtle)
+        with mock.patch.object(ai, '_select_move') as select_move:
+            self.assertEqual(ai.select_move(bulbasaur, squirtle), move)
+            self.assertFalse(select_move.called)
+        self.assertEqual(ai.cache_info()['transpositions']['hits'], 1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'transpositions')
+            ai.save_transpositions(path, DataVersion.current())
+            ai.clear_caches()
+            self.assertTrue(ai.load_transpositions(path, DataVersion.current()))
+            with mock.patch.object(ai, '_select_move') as select_move:
+                self.assertEqual(ai.select_move(bulbasaur, squirtle), move)
+                self.assertFalse(select_move.called)
+            # The saved moves are not used after the data or the AI settings changed.
+            ai.clear_caches()
+            bulbasaur.level = 60
+            bulbasaur.save()
+            self.assertFalse(ai.load_transpositions(path, DataVersion.current()))
+            self.assertEqual(len(ai._transpositions), 0)
+            ai.save_transpositions(path, DataVersion.current())
+            self.assertTrue(ai.load_transpositions(path, DataVersion.current()))
+            with mock.patch.object(ai, 'MAX_TURNS', 5):
+                self.assertFalse(ai.load_transpositions(path, DataVersion.current()))
+
+
+class BenchmarkTestCase(TestCase):
+    fixtures = ['benchmark_roster']
+
+    def test_benchmark(self):
+        """The benchmarks run on the fixture roster and give comparable results."""
+        names = ['select_move', 'select_move_without_stat_block', 'win_probability', 'battle']
+        stats = PokemonMixin.stats
+        results = benchmark.run(names, repeat=1)
+        self.assertEqual(results['pokemon'], benchmark.ROSTER_SIZE)
+        self.assertEqual(list(results['results']), names)
+        self.assertIs(PokemonMixin.stats, stats)
+        self.assertIn('1.00x', benchmark.report(results, json.loads(json.dumps(results))))
+
+
+def _api_resources():
+    """A tiny Pokemon API, {path: response}."""
+    def ref(endpoint, id_, name):
+        return {'name': name, 'url': f'/api/v2/{endpoint}/{id_}/'}
+
+    def move(id_, name, type_id, type_name, power, drain=0):
+        return {
+            'id': id_, 'name': name, 'power': power, 'accuracy': 100, 'pp': 35, 'priority': 0,
+            'type': ref('type', type_id, type_name), 'damage_class': {'name': 'physical'},
+            'stat_changes': [], 'effect_chance': None,
+            'meta': {'drain': drain, 'healing': 0, 'flinch_chance': 0, 'ailment': {'name': 'none'}, 'ailment_chance': 0},
+        }
+
+    def pokemon(id_, name, moves):
+        stats = ['hp', 'attack', 'defense', 'special-attack', 'special-defense', 'speed']
+        return {
+            'id': id_, 'name': name,
+            'stats': [{'base_stat': 50 + id_, 'stat': {'name': stat}} for stat in stats],
+            'types': [{'slot': 1, 'type': ref('type', 1, 'normal')}],
+            'moves': [{
+                'move': {'name': move_name},
+                'version_group_details': [{
+                    'version_group': {'name': 'black-white'}, 'move_learn_method': {'name': 'level-up'}
+                }],
+            } for move_name in moves],
+        }
+
+    resources = {
+        'nature': [
+            {'id': 1, 'name': 'quirky', 'increased_stat': None, 'decreased_stat': None},
+            {'id': 2, 'name': 'lonely', 'increased_stat': {'name': 'attack'}, 'decreased_stat': {'name': 'defense'}},
+        ],
+        'type': [
+            {'id': 1, 'name': 'normal', 'damage_relations': {
+                'double_damage_from': [ref('type', 2, 'fighting')], 'half_damage_from': [],
+                'no_damage_from': [ref('type', 10001, 'ghost')]}},
+            {'id': 2, 'name': 'fighting', 'damage_relations': {
+                'double_damage_from': [], 'half_damage_from': [], 'no_damage_from': []}},
+            {'id': 10001, 'name': 'ghost', 'damage_relations': {
+                'double_damage_from': [], 'half_damage_from': [], 'no_damage_from': []}},
+        ],
+        'ability': [{'id': 1, 'name': 'stench'}],
+        'move': [
+            move(1, 'tackle', 1, 'normal', 40),
+            move(2, 'karate-chop', 2, 'fighting', 50),
+            move(3, 'struggle', 1, 'normal', 50, drain=-25),
+        ],
+        'pokemon': [pokemon(1, 'eevee', ['tackle']), pokemon(2, 'jolteon', ['karate-chop'])],
+        'pokemon-species': [
+            {'id': 1, 'name': 'eevee', 'evolves_from_species': None},
+            {'id': 2, 'name': 'jolteon', 'evolves_from_species': ref('pokemon-species', 1, 'eevee')},
+        ],
+    }
+    paths = {}
+    for endpoint, objects in resources.items():
+        paths[f'/api/v2/{endpoint}/?limit=100000'] = {'results': [ref(endpoint, o['id'], o['name']) for o in objects]}
+        for o in objects:
+            paths[f'/api/v2/{endpoint}/{o["id"]}'] = o
+    return paths
+
+
+class LoadTestCase(TestCase):
+    """The loaders against a local stand-in for the Pokemon API."""
+
+    def setUp(self):
+        resources = _api_resources()
+        self.requested = []
+        self.failures = []  # Responses of the next requests: an HTTP status, or 'reset'.
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(handler):
+                self.requested.append(handler.path)
+                if self.failures:
+                    failure = self.failures.pop(0)
+                    if failure == 'reset':
+                        handler.close_connection = True     # Closed without a response.
+                    else:
+                        handler.send_error(failure)
+                    return
+                response = resources.get(handler.path)
+                if response is None:
+                    handler.send_error(404)
+                    return
+                body = json.dumps(response).encode()
+                handler.send_response(200)
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+        self.url = f'http://127.0.0.1:{self.server.server_port}/api/v2/'
+
+    def test_pokeapi(self):
+        """Resources are fetched once, later runs are served from the disk cache."""
+        api = PokeAPI(self.url, self.cache_dir, max_workers=4)
+        moves = api.get_all('move')
+        self.assertEqual([move.name for move in moves], ['tackle', 'karate-chop', 'struggle'])
+        self.assertEqual(moves[0].type.name, 'normal')
+        self.assertEqual(api.ids('type'), [1, 2])
+        self.assertEqual(api.requests, 5)
+        api = PokeAPI(self.url, self.cache_dir)
+        self.assertEqual(api.get('move', 2).power, 50)
+        self.assertEqual(api.requests, 0)
+        self.assertEqual(len(self.requested), 5)
+
+    def test_pokeapi_retries(self):
+        """Rate limits, server errors and reset connections are retried, other errors are not."""
+        api = PokeAPI(self.url, self.cache_dir, backoff=0)
+        self.failures = [429, 'reset', 503]
+        self.assertEqual(api.get('move', 1).name, 'tackle')
+        self.assertEqual(len(self.requested), 4)
+        self.failures = [404]
+        with self.assertRaises(urllib.error.HTTPError):
+            api.get('move', 2)
+        self.failures = ['reset'] * 5
+        with self.assertRaises(OSError):
+            api.get('move', 3)
+
+    def test_load_all(self):
+        """The full load with bulk queries, and the same data without the server from the cache."""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            load.load_all(PokeAPI(self.url, self.cache_dir))
+        self.assertIn('load_moves: 2 queries', output.getvalue())
+        # New data versions, so the saved transposition tables are not used.
+        self.assertEqual(set(DataVersion.current()), {'moves', 'species', 'pokemon', 'types'})
+        self.assertEqual(Nature.objects.get(name='lonely').increased_stat, 'attack')
+        self.assertEqual(list(Type.objects.get(name='normal').weaknesses.values_list('name', flat=True)), ['fighting'])
+        jolteon = Pokemon.objects.get(species__name='jolteon')
+        self.assertEqual(jolteon.species.evolves_from.name, 'eevee')
+        self.assertEqual(jolteon.species.speed, 52)
+        self.assertEqual(set(jolteon.moves.values_list('name', flat=True)), {'tackle', 'karate-chop', 'struggle'})
+        self.assertEqual(Move.objects.get(name='struggle').recoil, 25)
+        self.assertEqual(len(self.requested), len(set(self.requested)))
+        api = PokeAPI('http://127.0.0.1:1/', self.cache_dir)
+        self.assertEqual([species.name for species in api.get_all('pokemon-species')], ['eevee', 'jolteon'])
+        self.assertEqual(api.requests, 0)
+
+    def test_pre_evolutions(self):
+        """The closure is transitive, also for chains longer than the recursion limit."""
+        self.assertEqual(load.pre_evolutions({1: None, 2: 1, 3: 2, 4: 2}), {1: set(), 2: {1}, 3: {1, 2}, 4: {1, 2}})
+        chain = {i: i - 1 if i > 1 else None for i in range(1, 5001)}
+        self.assertEqual(load.pre_evolutions(chain)[5000], set(range(1, 5000)))
+        with self.assertRaises(ValueError):
+            load.pre_evolutions({1: 2, 2: 1})
+
+    def test_inherit_pre_evolution_moves(self):
+        """Moves of all pre-evolutions are added with one insert of the missing rows."""
+        normal = Type.objects.create(name='normal')
+        ability = Ability.objects.create(name='stench')
+        nature = Nature.objects.create(name='quirky')
+        stats = dict(hp=50, attack=50, defense=50, special_attack=50, special_defense=50, speed=50)
+        moves = [
+            Move.objects.create(name=name, power=40, priority=0, pp=35, accuracy=100, type=normal,
+                                drain=0, recoil=0, damage_class='PH')
+            for name in ['tackle', 'growl', 'bite']
+        ]
+        pokemons = []
+        evolves_from = None
+        for i, name in enumerate(['pichu', 'pikachu', 'raichu'], 1):
+            evolves_from = Species.objects.create(id=i, name=name, type1=normal, evolves_from=evolves_from, **stats)
+            pokemon = Pokemon.objects.create(species=evolves_from, ability=ability, nature=nature)
+            pokemon.moves.add(moves[i - 1], moves[0])
+            pokemons.append(pokemon)
+        with self.assertNumQueries(4):
+            self.assertEqual(load.inherit_pre_evolution_moves(), 1)
+        self.assertEqual(set(pokemons[2].moves.values_list('name', flat=True)), {'tackle', 'growl', 'bite'})
+        self.assertEqual(set(pokemons[1].moves.values_list('name', flat=True)), {'tackle', 'growl'})
+        self.assertEqual(load.inherit_pre_evolution_moves(), 0)